@@ -1,30 +1,27 @@
-import sqlite3
 from werkzeug.security import generate_password_hash
 import sys
-from engine.gatekeeper import init_users
+import secrets
+from database import get_db, IntegrityError
+from engine.gatekeeper import init_users, invalidate_user
 
 def create_admin(username, password, email):
     # Ensure tables are initialized and migrated first
     init_users()
     
-    conn = sqlite3.connect("cryptex.db")
-    cur = conn.cursor()
-    
     try:
-        # 1. Insert user with admin flag set to 1
-        cur.execute("""
-            INSERT INTO users (username, password, email, is_admin) 
-            VALUES (?, ?, ?, 1)
-        """, (username, generate_password_hash(password), email))
+        with get_db() as conn:
+            # 1. Insert user with admin flag set to 1
+            conn.execute("""
+                INSERT INTO users (username, password, email, is_admin, token_generation) 
+                VALUES (?, ?, ?, 1, ?)
+            """, (username, generate_password_hash(password), email, secrets.randbelow(2 ** 30)))
+        invalidate_user(username)
         
-        conn.commit()
         print(f"Successfully created Admin: {username}")
-    except sqlite3.IntegrityError:
+    except IntegrityError:
         print(f"Error: Username '{username}' or email '{email}' already exists.")
     except Exception as e:
         print(f"An error occurred: {e}")
-    finally:
-        conn.close()
 
 if __name__ == "__main__":
     if len(sys.argv) < 4:
@@ -0,0 +1,32 @@
+import sys
+from database import get_db
+from cloud.skystore import SkyStore
+from improvise.db import init_enhanced_tables
+from improvise.file_index import FileIndex
+from improvise.vault import Vault, HEADER_LEN
+
+def plaintext_size(username, filename):
+    info = SkyStore.stat(username, filename)
+    if info is None:
+        return None
+    header = b"".join(SkyStore.iter_range(username, filename, 0, HEADER_LEN))
+    if Vault.is_chunked(header):
+        return Vault.plaintext_size(header, info["size"])
+    # Legacy Fernet blob: size is only known after decryption
+    return len(Vault.decrypt_data(SkyStore.get_file_data(username, filename)))
+
+def index_files(usernames):
+    # /files is served from file_metadata: register stored objects that have no row yet
+    init_enhanced_tables()
+    for username in usernames:
+        names = SkyStore.list_files(username)
+        added = FileIndex.index_storage(username, names, lambda name: plaintext_size(username, name))
+        print(f"[+] {username}: {len(names)} stored objects, {added} added to the file index")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        index_files(sys.argv[1:])
+    else:
+        with get_db() as conn:
+            users = [row[0] for row in conn.execute("SELECT username FROM users").fetchall()]
+        index_files(users)
@@ -1,16 +1,16 @@
-import sqlite3
 import sys
+from database import get_db
+from engine.gatekeeper import invalidate_user
 
 def promote_to_admin(username):
-    conn = sqlite3.connect("cryptex.db")
-    cur = conn.cursor()
-    cur.execute("UPDATE users SET is_admin = 1 WHERE username = ?", (username,))
-    if cur.rowcount > 0:
-        print(f"User {username} is now an admin.")
-    else:
-        print(f"User {username} not found.")
-    conn.commit()
-    conn.close()
+    with get_db() as conn:
+        cur = conn.execute("UPDATE users SET is_admin = 1 WHERE username = ?", (username,))
+        if cur.rowcount > 0:
+            print(f"User {username} is now an admin.")
+        else:
+            print(f"User {username} not found.")
+    # Running app processes pick the change up at once with Redis, otherwise within USER_CACHE_TTL
+    invalidate_user(username)
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
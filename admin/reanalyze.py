@@ -0,0 +1,225 @@
+"""
+Re-scores every file in file_metadata with the current AIAnalyzer rules.
+
+    python admin/reanalyze.py [--workers N] [--batch-size N] [--owner USER] [--full] [--resume] [--retry-failed]
+
+Objects are fetched and decrypted in streaming mode across a process pool.
+Files that already have a hash and size only need their first segment
+decrypted (for content sniffing); --full re-reads and re-hashes everything.
+Blob-backed entries sharing content are analyzed once per blob. Results are
+written back in one transaction per batch, and progress is checkpointed to a
+JSON file so an interrupted run continues with --resume. Rows that failed
+are recorded there too; --retry-failed re-processes only those.
+"""
+import os
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from database import get_db
+from cloud.backends import get_backend
+from improvise.db import init_enhanced_tables
+from improvise.ai_analyzer import AIAnalyzer
+from improvise.blobstore import BlobStore
+from improvise.pipeline import DownloadStream
+from improvise.self_healing import QuarantineQueue, QUARANTINE_THRESHOLD, QUARANTINE_SUFFIX
+from improvise.sniffer import SNIFF_BYTES, sniff
+
+CHECKPOINT = "reanalyze.checkpoint.json"
+
+def inspect_object(job):
+    """
+    Worker: decrypts one stored object and returns
+    (size, file_hash, mime_type, bytes actually decrypted).
+    """
+    key, known_size, known_hash, full = job
+    info = get_backend().stat(key)
+    if info is None:
+        raise FileNotFoundError(key)
+    stream = DownloadStream(key, info)
+
+    if not full and known_hash and known_size == stream.size:
+        head = b"".join(stream.iter_range(0, min(SNIFF_BYTES, stream.size)))
+        return stream.size, known_hash, sniff(head), len(head)
+
+    hasher = hashlib.sha256()
+    head = bytearray()
+    for block in stream.iter_range(0, stream.size):
+        hasher.update(block)
+        if len(head) < SNIFF_BYTES:
+            head += block[:SNIFF_BYTES - len(head)]
+    return stream.size, hasher.hexdigest(), sniff(bytes(head)), stream.size
+
+def _safe_inspect(job):
+    try:
+        return inspect_object(job), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+def default_state():
+    return {"last_id": 0, "files": 0, "bytes": 0, "failed_ids": [], "elapsed": 0.0}
+
+def load_checkpoint(path):
+    state = default_state()
+    if os.path.exists(path):
+        with open(path) as f:
+            state.update(json.load(f))
+    return state
+
+def save_checkpoint(path, state):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+def fetch_batch(last_id, batch_size, owner=None):
+    sql = """
+        SELECT id, owner, filename, size, file_hash, storage_key, is_active
+        FROM file_metadata
+        WHERE id > ?
+    """
+    params = [last_id]
+    if owner:
+        sql += " AND owner = ?"
+        params.append(owner)
+    sql += " ORDER BY id LIMIT ?"
+    params.append(batch_size)
+    with get_db() as conn:
+        return [dict(row) for row in conn.execute(sql, params).fetchall()]
+
+def fetch_ids(ids):
+    if not ids:
+        return []
+    placeholders = ", ".join("?" * len(ids))
+    with get_db() as conn:
+        rows = conn.execute(f"""
+            SELECT id, owner, filename, size, file_hash, storage_key, is_active
+            FROM file_metadata
+            WHERE id IN ({placeholders})
+            ORDER BY id
+        """, list(ids)).fetchall()
+    return [dict(row) for row in rows]
+
+def scored_name(row):
+    """The name a row is scored by: quarantined files keep their original extension."""
+    filename = row["filename"]
+    if not row["is_active"] and filename.endswith(QUARANTINE_SUFFIX):
+        return filename[:-len(QUARANTINE_SUFFIX)]
+    return filename
+
+def write_back(results):
+    """Writes one batch of (row, size, file_hash, mime_type) in a single transaction."""
+    updates = []
+    to_quarantine = []
+    for row, size, file_hash, mime_type in results:
+        risk_score, reasons = AIAnalyzer.score(scored_name(row), size, file_hash, mime_type)
+        summary = "; ".join(reasons) if reasons else "File appears safe."
+        updates.append((file_hash, size, mime_type, risk_score, summary, row["id"]))
+        if risk_score > QUARANTINE_THRESHOLD and row["is_active"]:
+            to_quarantine.append((row["owner"], row["filename"], risk_score))
+
+    with get_db() as conn:
+        conn.executemany("""
+            UPDATE file_metadata
+            SET file_hash = ?, size = ?, mime_type = ?, risk_score = ?, ai_analysis = ?
+            WHERE id = ?
+        """, updates)
+        for owner, filename, risk_score in to_quarantine:
+            QuarantineQueue.enqueue(owner, filename, risk_score, db=conn)
+    return len(to_quarantine)
+
+def process_batch(pool, rows, full):
+    """Inspects and re-scores one batch; returns (results written, ids that failed, bytes read, quarantined)."""
+    # One job per distinct object: deduplicated entries share a blob
+    jobs = {}
+    for row in rows:
+        key = row["storage_key"] or BlobStore.legacy_key(row["owner"], row["filename"])
+        row["key"] = key
+        jobs.setdefault(key, (key, row["size"], row["file_hash"], full))
+    keys = list(jobs)
+    outcomes = dict(zip(keys, pool.map(_safe_inspect, [jobs[k] for k in keys], chunksize=4)))
+
+    results = []
+    failed_ids = []
+    for row in rows:
+        outcome, error = outcomes[row["key"]]
+        if error:
+            failed_ids.append(row["id"])
+            print(f"[REANALYZE ERROR] {row['owner']}/{row['filename']}: {error}")
+            continue
+        results.append((row,) + outcome[:3])
+    queued = write_back(results)
+    bytes_read = sum(outcomes[k][0][3] for k in keys if outcomes[k][0])
+    return len(results), failed_ids, bytes_read, queued
+
+def report(state, queued=0, done=False):
+    elapsed = max(state["elapsed"], 1e-9)
+    rates = (
+        f"{state['files'] / elapsed:,.1f} files/s "
+        f"{state['bytes'] / elapsed / 1024 / 1024:,.1f} MB/s decrypted"
+    )
+    if done:
+        print(
+            f"[REANALYZE] Done: {state['files']} files, {len(state['failed_ids'])} failed, "
+            f"{state['bytes'] / 1024 / 1024:,.1f} MB decrypted in {elapsed:,.1f}s ({rates})"
+        )
+    else:
+        print(
+            f"[REANALYZE] id<={state['last_id']} files={state['files']} failed={len(state['failed_ids'])} "
+            f"quarantine+={queued} | {rates}"
+        )
+
+def reanalyze(workers, batch_size, checkpoint, resume, owner=None, full=False, retry_failed=False):
+    init_enhanced_tables()
+    state = load_checkpoint(checkpoint) if resume or retry_failed else default_state()
+    if resume and state["last_id"]:
+        print(f"[REANALYZE] Resuming after id {state['last_id']} ({state['files']} files done)")
+
+    started = time.perf_counter() - state["elapsed"]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        if retry_failed:
+            # Only the rows recorded as failed; the rest of the checkpoint is kept
+            retry_ids, state["failed_ids"] = state["failed_ids"], []
+            print(f"[REANALYZE] Retrying {len(retry_ids)} failed rows")
+            batches = (fetch_ids(retry_ids[i:i + batch_size]) for i in range(0, len(retry_ids), batch_size))
+        else:
+            batches = None
+
+        while True:
+            rows = next(batches, None) if batches is not None else fetch_batch(state["last_id"], batch_size, owner)
+            if not rows:
+                break
+            written, failed_ids, bytes_read, queued = process_batch(pool, rows, full)
+
+            if batches is None:
+                state["last_id"] = rows[-1]["id"]
+            state["failed_ids"].extend(failed_ids)
+            state["files"] += written
+            state["bytes"] += bytes_read
+            state["elapsed"] = time.perf_counter() - started
+            save_checkpoint(checkpoint, state)
+            report(state, queued)
+
+    state["elapsed"] = time.perf_counter() - started
+    report(state, done=True)
+    if state["failed_ids"]:
+        # Kept so the failures can be retried with --retry-failed
+        save_checkpoint(checkpoint, state)
+        print(f"[REANALYZE] {len(state['failed_ids'])} failed rows recorded in {checkpoint}")
+    elif os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return state
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-score stored files with the current AIAnalyzer rules")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--checkpoint", default=CHECKPOINT)
+    parser.add_argument("--resume", action="store_true", help="continue from the checkpoint file")
+    parser.add_argument("--owner", help="only re-analyze this user's files")
+    parser.add_argument("--full", action="store_true", help="decrypt and re-hash every object")
+    parser.add_argument("--retry-failed", action="store_true", help="re-process only the rows that failed last time")
+    args = parser.parse_args()
+    reanalyze(args.workers, args.batch_size, args.checkpoint, args.resume, args.owner, args.full, args.retry_failed)
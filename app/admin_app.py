@@ -3,6 +3,7 @@ from flask_mail import Mail, Message
 from flask_cors import CORS
 import jwt
 import os
+from datetime import datetime, timezone
 
 from config import *
 from engine.gatekeeper import (
@@ -19,7 +20,8 @@ from engine.auth import jwt_required, admin_required
 # 🚀 IMPROVISE IMPORTS
 from improvise import (
     bootstrap_improvements,
-    AuditLogger
+    AuditLogger,
+    StatsEngine
 )
 
 app = Flask(__name__)
@@ -107,31 +109,44 @@ def admin_dashboard_page():
     except Exception:
         return redirect(url_for("admin_login_page"))
 
+def _parse_log_time(value):
+    """Normalizes an ISO 8601 time (UTC unless it has an offset) to the audit_logs "YYYY-MM-DD HH:MM:SS" format."""
+    if not value:
+        return None
+    if value.endswith(("Z", "z")):
+        value = value[:-1] + "+00:00"
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc)
+    return parsed.strftime("%Y-%m-%d %H:%M:%S")
+
 @app.route("/api/admin/logs")
 @admin_required
 def get_admin_logs(user):
-    logs = AuditLogger.get_all_logs()
-    return {"logs": logs}
+    args = request.args
+    try:
+        return AuditLogger.query_logs(
+            limit=args.get("limit", 100, type=int),
+            cursor=args.get("cursor", type=int),
+            username=args.get("user"),
+            action_prefix=args.get("action"),
+            status=args.get("status"),
+            since=_parse_log_time(args.get("since")),
+            until=_parse_log_time(args.get("until"))
+        )
+    except ValueError:
+        return {"error": "invalid time filter (expected ISO 8601)"}, 400
+
+@app.route("/api/admin/audit/metrics")
+@admin_required
+def get_audit_metrics(user):
+    # Every process (user app workers and this one) publishes its own writer's metrics
+    return {"audit_writer": AuditLogger.cluster_metrics()}
 
 @app.route("/api/admin/stats")
 @admin_required
 def get_admin_stats(user):
-    from improvise.db import get_db_context
-    stats = {}
-    
-    with get_db_context() as db:
-        stats["total_users"] = db.execute("SELECT COUNT(*) FROM users").fetchone()[0]
-        stats["total_files"] = db.execute("SELECT COUNT(*) FROM file_metadata").fetchone()[0]
-        avg_risk = db.execute("SELECT AVG(risk_score) FROM file_metadata").fetchone()[0]
-        stats["avg_risk"] = round(avg_risk, 1) if avg_risk else 0
-        stats["quarantined"] = db.execute("SELECT COUNT(*) FROM file_metadata WHERE is_active=0").fetchone()[0]
-        stats["risk_dist"] = {
-            "safe": db.execute("SELECT COUNT(*) FROM file_metadata WHERE risk_score < 50").fetchone()[0],
-            "warning": db.execute("SELECT COUNT(*) FROM file_metadata WHERE risk_score >= 50 AND risk_score < 80").fetchone()[0],
-            "critical": db.execute("SELECT COUNT(*) FROM file_metadata WHERE risk_score >= 80").fetchone()[0]
-        }
-        
-    return stats
+    return StatsEngine.get_stats()
 
 @app.route("/logout", methods=["POST"])
 def logout():
@@ -2,7 +2,6 @@ from flask import Flask, request, session, send_from_directory, render_template,
 from flask_mail import Mail, Message
 import jwt
 import os
-import io
 import re
 import shutil
 from flask_cors import CORS
@@ -13,8 +12,10 @@ from engine.gatekeeper import (
     init_users,
     verify_user,
     generate_otp,
+    cancel_otp,
     verify_otp,
     register_user,
+    revoke_tokens,
     get_email,
     is_admin,
     delete_user_db
@@ -25,11 +26,20 @@ from engine.auth import jwt_required, admin_required
 # 🚀 IMPROVISE IMPORTS
 from improvise import (
     bootstrap_improvements,
-    Vault,
     AIAnalyzer,
     AuditLogger,
-    SecurityHarden
+    SecurityHarden,
+    BlobStore,
+    FileIndex,
+    MultipartFileReader,
+    UploadPipeline,
+    UploadTooLarge,
+    ContentHashMismatch,
+    KnownBadContent,
+    DownloadStream
 )
+from improvise.hashing import is_sha256_hex
+from improvise.mailer import send_mail
 
 app = Flask(__name__)
 app.secret_key = SECRET_KEY
@@ -137,14 +147,15 @@ def send_otp():
     )
     msg.body = f"Your CryptexDrive OTP is: {otp}"
     
-    try:
-        mail.send(msg)
-        AuditLogger.log_event(user, "send_otp", "success")
+    # 📬 Delivered in the background; the outcome is audited as send_otp:delivery
+    if send_mail(app, mail, msg, user, "send_otp"):
+        AuditLogger.log_event(user, "send_otp", "queued" if MAIL_ASYNC else "success")
         return {"status": "otp sent"}
-    except Exception as e:
-        print(f"Mail Error: {e}")
-        AuditLogger.log_event(user, "send_otp", "failed")
-        return {"error": f"Failed to send email: {str(e)}"}, 500
+
+    # Not queued: don't hold the user to the resend cooldown for a code they never get
+    cancel_otp(user)
+    AuditLogger.log_event(user, "send_otp", "failed")
+    return {"error": "failed to send email, try again later"}, 503
 
 
 # =====================
@@ -202,47 +213,57 @@ def secure(user):
 @app.route("/upload", methods=["POST"])
 @jwt_required
 def upload(user):
-    if "file" not in request.files:
+    if request.content_length and request.content_length > MAX_CONTENT_LENGTH + 64 * 1024:
+        return {"error": "file too large"}, 413
+
+    # Optional client-declared digest: enables early rejection and dedup (verified at end of stream)
+    declared_hash = request.headers.get("X-Content-SHA256")
+    if declared_hash is not None and not is_sha256_hex(declared_hash):
+        return {"error": "invalid X-Content-SHA256 header"}, 400
+
+    # 1. Locate the file part in the raw request stream (nothing is spooled to disk)
+    try:
+        reader = MultipartFileReader(request.stream, request.content_type)
+        client_filename = reader.find_file("file")
+    except ValueError:
+        return {"error": "malformed upload"}, 400
+
+    if not client_filename:
         return {"error": "no file"}, 400
 
-    file = request.files["file"]
-    
-    # 1. Sanitize filename
-    filename = SecurityHarden.sanitize_path(file.filename)
-    
-    user_dir = os.path.join(UPLOAD_FOLDER, user)
-    os.makedirs(user_dir, exist_ok=True)
-    
-    file_path = os.path.join(user_dir, filename)
-    file.save(file_path)
+    # 2. Sanitize filename
+    filename = SecurityHarden.sanitize_path(client_filename)
+    if not filename:
+        return {"error": "invalid filename"}, 400
+
+    # 3. Single pass: hash + size check + encryption + cloud storage (deduplicated by content)
+    pipeline = UploadPipeline(user, filename, declared_hash=declared_hash, reject_hash=AIAnalyzer.is_known_bad)
+    try:
+        result = pipeline.run(reader.iter_data())
+    except UploadTooLarge:
+        AuditLogger.log_event(user, f"upload:{filename}", "failed:too_large")
+        return {"error": "file too large"}, 413
+    except ContentHashMismatch:
+        AuditLogger.log_event(user, f"upload:{filename}", "failed:hash_mismatch")
+        return {"error": "content does not match X-Content-SHA256"}, 400
+    except KnownBadContent:
+        AuditLogger.log_event(user, f"upload:{filename}", "blocked:known_bad_hash")
+        return {"error": "file rejected: content matches a known-malicious file"}, 422
+    except Exception as e:
+        AuditLogger.log_event(user, f"upload:{filename}", f"failed:encryption_or_cloud_error:{str(e)}")
+        return {"error": "failed to secure file"}, 500
 
-    # 2. AI Analysis
-    analysis = AIAnalyzer.analyze_file(file_path, filename, user)
+    # 4. AI Analysis (inputs collected by the pipeline, no re-read)
+    analysis = AIAnalyzer.analyze_upload(
+        filename, user, result["size"], result["file_hash"], result["storage_key"], result["mime_type"]
+    )
     
     # 🛡️ IMMEDIATE SELF-HEALING: If risk is extreme, blacklist the token immediately
     if analysis["risk_score"] >= 90:
         token = request.headers.get("Authorization") or session.get("dynamic_id")
         SecurityHarden.detect_intrusion_and_blacklist(token, "Extreme Risk File Upload")
     
-    # 3. Encryption & Cloud Storage
-    try:
-        with open(file_path, "rb") as f:
-            raw_data = f.read()
-        
-        encrypted_data = Vault.encrypt_data(raw_data)
-        
-        # Save to SkyStore (Hybrid)
-        SkyStore.save_file(user, filename, encrypted_data)
-        
-        # Optionally remove the temp local file if using S3
-        if SkyStore.get_client() and S3_BUCKET:
-             os.remove(file_path)
-
-    except Exception as e:
-        AuditLogger.log_event(user, f"upload:{filename}", f"failed:encryption_or_cloud_error:{str(e)}")
-        return {"error": "failed to secure file"}, 500
-    
-    # 4. Audit Log
+    # 5. Audit Log
     AuditLogger.log_event(user, f"upload:{filename}", "success")
 
 
@@ -259,10 +280,25 @@ def upload(user):
 @app.route("/files", methods=["GET"])
 @jwt_required
 def files(user):
-    all_files = SkyStore.list_files(user)
-    # Filter out .quarantine files
-    safe_files = [f for f in all_files if not f.endswith(".quarantine")]
-    return {"files": safe_files}
+    # Served from file_metadata (quarantined files are inactive), one page at a time
+    args = request.args
+    try:
+        page = FileIndex.list_files(
+            user,
+            limit=args.get("limit", 100, type=int),
+            cursor=args.get("cursor"),
+            sort=args.get("sort", "name"),
+            order=args.get("order", "asc"),
+            prefix=args.get("prefix")
+        )
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    return {
+        "files": [entry["filename"] for entry in page["files"]],
+        "entries": page["files"],
+        "next_cursor": page["next_cursor"]
+    }
 
 
 # =====================
@@ -275,22 +311,46 @@ def download(user, filename):
     filename = SecurityHarden.sanitize_path(filename)
     
     try:
-        # Get encrypted data from SkyStore
-        encrypted_data = SkyStore.get_file_data(user, filename)
+        # Open a seekable view: only the header is fetched up front
+        stream = DownloadStream.open(user, filename)
         
-        if encrypted_data is None:
+        if stream is None:
             AuditLogger.log_event(user, f"download:{filename}", "failed:not_found")
             return {"error": "file not found"}, 404
 
-        # Decrypt in memory
-        decrypted_data = Vault.decrypt_data(encrypted_data)
+        headers = {
+            "Content-Disposition": f"attachment;filename={filename}",
+            "Accept-Ranges": "bytes",
+            "ETag": f'"{stream.etag}"'
+        }
+
+        if request.if_none_match.contains_weak(stream.etag):
+            return Response(status=304, headers=headers)
+
+        # HTTP Range: decrypt only the segments covering the requested bytes
+        start, stop, status = 0, stream.size, 200
+        byte_range = request.range
+        if_range = request.if_range
+        if byte_range and if_range.date is None and if_range.etag in (None, stream.etag):
+            bounds = byte_range.range_for_length(stream.size)
+            if bounds:
+                start, stop = bounds
+                status = 206
+                headers["Content-Range"] = f"bytes {start}-{stop - 1}/{stream.size}"
+            elif len(byte_range.ranges) == 1:
+                return Response(status=416, headers={"Content-Range": f"bytes */{stream.size}"})
+
+        headers["Content-Length"] = str(stop - start)
         
         AuditLogger.log_event(user, f"download:{filename}", "success")
         
+        # Decrypt on the fly: segments are yielded as they are fetched
         return Response(
-            io.BytesIO(decrypted_data),
+            stream.iter_range(start, stop),
+            status=status,
             mimetype="application/octet-stream",
-            headers={"Content-Disposition": f"attachment;filename={filename}"}
+            headers=headers,
+            direct_passthrough=True
         )
     except Exception as e:
         AuditLogger.log_event(user, f"download:{filename}", f"failed:{str(e)}")
@@ -312,6 +372,9 @@ def delete_account(user):
         AuditLogger.log_event(user, "delete_account", "failed:invalid_password")
         return {"error": "invalid password"}, 401
 
+    # 🛑 Revoke every session of the account before tearing it down
+    revoke_tokens(user)
+
     # 2. Delete Files from Storage
     try:
         user_files = SkyStore.list_files(user)
@@ -320,11 +383,9 @@ def delete_account(user):
     except Exception as e:
         print(f"Error cleaning up storage for user {user}: {e}")
 
-    # 3. Delete Metadata from DB
-    from improvise.db import get_db_context
+    # 3. Delete Metadata from DB (releasing the blobs it references)
     try:
-        with get_db_context() as db:
-            db.execute("DELETE FROM file_metadata WHERE owner = ?", (user,))
+        BlobStore.delete_entries(user)
     except Exception as e:
         print(f"Error deleting metadata: {e}")
 
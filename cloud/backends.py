@@ -0,0 +1,493 @@
+import os
+import io
+import shutil
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from config import (
+    S3_BUCKET, S3_KEY, S3_SECRET, S3_REGION, S3_ENDPOINT, UPLOAD_FOLDER, VAULT_CHUNK_SIZE,
+    S3_MAX_POOL_CONNECTIONS, S3_MAX_ATTEMPTS, S3_CONNECT_TIMEOUT, S3_READ_TIMEOUT,
+    S3_MULTIPART_THRESHOLD, S3_PART_SIZE, S3_TRANSFER_CONCURRENCY, STORAGE_BACKEND
+)
+
+# ♻️ Process-wide S3 client: boto3 clients are thread-safe, so one per process
+# shares its connection pool across requests. It is rebuilt after fork so
+# gunicorn workers never share sockets inherited from the master.
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def _reset_after_fork():
+    global _client, _client_pid
+    _client = None
+    _client_pid = None
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def get_s3_client():
+    """Returns the cached S3 client for this process (None if S3 is not configured)."""
+    global _client, _client_pid
+    if not (S3_KEY and S3_SECRET):
+        return None
+
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+
+    with _client_lock:
+        if _client is None or _client_pid != pid:
+            _client = boto3.session.Session().client(
+                's3',
+                aws_access_key_id=S3_KEY,
+                aws_secret_access_key=S3_SECRET,
+                region_name=S3_REGION,
+                endpoint_url=S3_ENDPOINT,
+                config=Config(
+                    max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+                    retries={"max_attempts": S3_MAX_ATTEMPTS, "mode": "standard"},
+                    connect_timeout=S3_CONNECT_TIMEOUT,
+                    read_timeout=S3_READ_TIMEOUT
+                )
+            )
+            _client_pid = pid
+    return _client
+
+class _ChunkReader(io.RawIOBase):
+    """Read-only file object over an iterator of byte chunks (for upload_fileobj)."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buf = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buf:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._buf = chunk
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+    def read(self, size=-1):
+        # Fill the whole request: s3transfer treats a short read as end of stream
+        # when deciding between a single PUT and a multipart upload
+        parts = []
+        remaining = size
+        while remaining is None or remaining < 0 or remaining > 0:
+            if not self._buf:
+                chunk = next(self._chunks, None)
+                if chunk is None:
+                    break
+                self._buf = chunk
+                continue
+            if remaining is None or remaining < 0:
+                take = self._buf
+            else:
+                take = self._buf[:remaining]
+                remaining -= len(take)
+            self._buf = self._buf[len(take):]
+            parts.append(take)
+        return b"".join(parts)
+
+class StorageBackend(ABC):
+    """
+    Object storage contract used by SkyStore. Keys are "/"-separated paths
+    ("<user>/<filename>"); every method is safe to call from multiple threads.
+    """
+
+    name = "abstract"
+
+    def save(self, key, data):
+        """Stores `data` under `key`, replacing any existing object."""
+        return self.save_stream(key, [data])
+
+    @abstractmethod
+    def save_stream(self, key, chunks):
+        """Stores an iterable of byte chunks under `key`; nothing is visible until it completes."""
+
+    def get(self, key):
+        """Returns the object bytes, or None if it does not exist."""
+        if self.stat(key) is None:
+            return None
+        return b"".join(self.iter_range(key))
+
+    @abstractmethod
+    def stat(self, key):
+        """Returns {"size", "etag"} for `key`, or None if it does not exist."""
+
+    @abstractmethod
+    def iter_range(self, key, offset=0, length=None, chunk_size=None):
+        """Yields the bytes [offset, offset + length) of `key` in blocks; raises FileNotFoundError if it does not exist."""
+
+    def copy(self, src_key, dst_key):
+        """Copies `src_key` to `dst_key` inside the store; returns False if the source does not exist."""
+        if self.stat(src_key) is None:
+            return False
+        self.save_stream(dst_key, self.iter_range(src_key))
+        return True
+
+    def move(self, src_key, dst_key):
+        """Renames `src_key` to `dst_key`; returns False if the source does not exist."""
+        if not self.copy(src_key, dst_key):
+            return False
+        self.delete(src_key)
+        return True
+
+    @abstractmethod
+    def list(self, prefix):
+        """
+        Returns the names of the objects directly under `prefix` (which ends in "/"),
+        with the prefix stripped. Like a directory listing, deeper keys are left out.
+        """
+
+    @abstractmethod
+    def delete(self, key):
+        """Deletes `key`; returns False if it did not exist."""
+
+class LocalBackend(StorageBackend):
+    """Stores objects as files under a root directory."""
+
+    name = "local"
+
+    def __init__(self, root=UPLOAD_FOLDER):
+        self.root = root
+
+    def path(self, key):
+        return os.path.join(self.root, *key.split("/"))
+
+    def save_stream(self, key, chunks):
+        file_path = self.path(key)
+        directory, filename = os.path.split(file_path)
+        os.makedirs(directory, exist_ok=True)
+        # Write next to the target and swap in atomically once complete
+        tmp_path = os.path.join(directory, f".{filename}.part")
+
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return True
+
+    def stat(self, key):
+        file_path = self.path(key)
+        if not os.path.isfile(file_path):
+            return None
+        st = os.stat(file_path)
+        return {
+            "size": st.st_size,
+            "etag": f"{st.st_mtime_ns:x}-{st.st_size:x}"
+        }
+
+    def iter_range(self, key, offset=0, length=None, chunk_size=None):
+        chunk_size = chunk_size or VAULT_CHUNK_SIZE
+        with open(self.path(key), "rb") as f:
+            f.seek(offset)
+            remaining = length
+            while remaining is None or remaining > 0:
+                block = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not block:
+                    break
+                if remaining is not None:
+                    remaining -= len(block)
+                yield block
+
+    def copy(self, src_key, dst_key):
+        src_path = self.path(src_key)
+        if not os.path.isfile(src_path):
+            return False
+        directory, filename = os.path.split(self.path(dst_key))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = os.path.join(directory, f".{filename}.part")
+        try:
+            shutil.copyfile(src_path, tmp_path)
+            os.replace(tmp_path, self.path(dst_key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return True
+
+    def move(self, src_key, dst_key):
+        # A rename within the same root: no data is copied
+        src_path = self.path(src_key)
+        if not os.path.isfile(src_path):
+            return False
+        dst_path = self.path(dst_key)
+        os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+        os.replace(src_path, dst_path)
+        return True
+
+    def list(self, prefix):
+        directory = self.path(prefix.rstrip("/"))
+        if not os.path.isdir(directory):
+            return []
+        # Dotfiles are in-flight partial uploads (sanitized names never start with ".")
+        return [
+            f for f in os.listdir(directory)
+            if not f.startswith(".") and os.path.isfile(os.path.join(directory, f))
+        ]
+
+    def delete(self, key):
+        file_path = self.path(key)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+            return True
+        return False
+
+class S3Backend(StorageBackend):
+    """
+    Stores objects in an S3-compatible bucket through the shared client.
+    Objects above the multipart threshold are uploaded as parallel multipart
+    parts and read back with parallel ranged GETs, reassembled in order.
+    """
+
+    name = "s3"
+
+    def __init__(self, bucket=S3_BUCKET, part_size=S3_PART_SIZE,
+                 concurrency=S3_TRANSFER_CONCURRENCY, multipart_threshold=S3_MULTIPART_THRESHOLD):
+        self.bucket = bucket
+        self.part_size = part_size
+        self.concurrency = max(1, concurrency)
+        self.multipart_threshold = multipart_threshold
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=part_size,
+            max_concurrency=self.concurrency,
+            use_threads=self.concurrency > 1
+        )
+
+    @property
+    def client(self):
+        return get_s3_client()
+
+    def save(self, key, data):
+        if len(data) < self.multipart_threshold:
+            self.client.put_object(Bucket=self.bucket, Key=key, Body=data)
+            return True
+        self.client.upload_fileobj(io.BytesIO(data), self.bucket, key, Config=self.transfer_config)
+        return True
+
+    def save_stream(self, key, chunks):
+        # Non-seekable source: s3transfer reads one part at a time and uploads up to
+        # `concurrency` parts in parallel (aborting the multipart upload on error)
+        self.client.upload_fileobj(_ChunkReader(chunks), self.bucket, key, Config=self.transfer_config)
+        return True
+
+    def get(self, key):
+        info = self.stat(key)
+        if info is None:
+            return None
+        return b"".join(self.iter_range(key, 0, info["size"]))
+
+    def stat(self, key):
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return None
+            raise
+        return {
+            "size": response["ContentLength"],
+            "etag": response["ETag"].strip('"')
+        }
+
+    def _get_object(self, key, offset, length):
+        try:
+            return self.client.get_object(
+                Bucket=self.bucket, Key=key, Range=f"bytes={offset}-{offset + length - 1}"
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                raise FileNotFoundError(key) from None
+            raise
+
+    def _get_part(self, key, offset, length):
+        return self._get_object(key, offset, length)['Body'].read()
+
+    def iter_range(self, key, offset=0, length=None, chunk_size=None):
+        chunk_size = chunk_size or VAULT_CHUNK_SIZE
+        if length is None:
+            info = self.stat(key)
+            if info is None:
+                raise FileNotFoundError(key)
+            length = info["size"] - offset
+        if length <= 0:
+            return
+
+        if length < self.multipart_threshold or self.concurrency == 1:
+            response = self._get_object(key, offset, length)
+            yield from response['Body'].iter_chunks(chunk_size)
+            return
+
+        # Parallel ranged GETs: at most `concurrency` parts in flight, yielded in order
+        parts = (
+            (pos, min(self.part_size, offset + length - pos))
+            for pos in range(offset, offset + length, self.part_size)
+        )
+        pool = ThreadPoolExecutor(max_workers=self.concurrency)
+        pending = deque()
+        try:
+            for part in parts:
+                pending.append(pool.submit(self._get_part, key, *part))
+                if len(pending) >= self.concurrency:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+            pool.shutdown(wait=False)
+
+    def copy(self, src_key, dst_key):
+        # Server-side copy: the bytes never pass through this process. Large objects
+        # use a parallel multipart copy (single CopyObject calls are capped at 5 GB)
+        info = self.stat(src_key)
+        if info is None:
+            return False
+        source = {"Bucket": self.bucket, "Key": src_key}
+        if info["size"] < self.multipart_threshold:
+            self.client.copy_object(Bucket=self.bucket, Key=dst_key, CopySource=source)
+        else:
+            self.client.copy(source, self.bucket, dst_key, Config=self.transfer_config)
+        return True
+
+    def move(self, src_key, dst_key):
+        if not self.copy(src_key, dst_key):
+            return False
+        self.client.delete_object(Bucket=self.bucket, Key=src_key)
+        return True
+
+    def list(self, prefix):
+        names = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        # The delimiter groups deeper keys into CommonPrefixes, which are skipped
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix, Delimiter="/"):
+            for obj in page.get('Contents', []):
+                name = obj['Key'][len(prefix):]
+                if name: # Avoid empty folder entries
+                    names.append(name)
+        return names
+
+    def delete(self, key):
+        if self.stat(key) is None:
+            return False
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+        return True
+
+class MemoryBackend(StorageBackend):
+    """Keeps objects in a dict; for tests and local benchmarking."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._objects = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def save_stream(self, key, chunks):
+        data = b"".join(chunks)
+        with self._lock:
+            self._objects[key] = data
+            self._versions[key] = self._versions.get(key, 0) + 1
+        return True
+
+    def get(self, key):
+        with self._lock:
+            return self._objects.get(key)
+
+    def stat(self, key):
+        with self._lock:
+            if key not in self._objects:
+                return None
+            return {
+                "size": len(self._objects[key]),
+                "etag": f"{self._versions[key]:x}-{len(self._objects[key]):x}"
+            }
+
+    def iter_range(self, key, offset=0, length=None, chunk_size=None):
+        chunk_size = chunk_size or VAULT_CHUNK_SIZE
+        with self._lock:
+            data = self._objects.get(key)
+        if data is None:
+            raise FileNotFoundError(key)
+        stop = len(data) if length is None else min(len(data), offset + length)
+        for pos in range(offset, stop, chunk_size):
+            yield data[pos:min(pos + chunk_size, stop)]
+
+    def copy(self, src_key, dst_key):
+        with self._lock:
+            if src_key not in self._objects:
+                return False
+            self._objects[dst_key] = self._objects[src_key]
+            self._versions[dst_key] = self._versions.get(dst_key, 0) + 1
+        return True
+
+    def move(self, src_key, dst_key):
+        with self._lock:
+            if src_key not in self._objects:
+                return False
+            self._objects[dst_key] = self._objects.pop(src_key)
+            self._versions.pop(src_key, None)
+            self._versions[dst_key] = self._versions.get(dst_key, 0) + 1
+        return True
+
+    def list(self, prefix):
+        with self._lock:
+            return [
+                key[len(prefix):] for key in self._objects
+                if key.startswith(prefix) and "/" not in key[len(prefix):]
+            ]
+
+    def delete(self, key):
+        with self._lock:
+            self._versions.pop(key, None)
+            return self._objects.pop(key, None) is not None
+
+BACKENDS = {
+    "local": LocalBackend,
+    "s3": S3Backend,
+    "memory": MemoryBackend,
+}
+
+def create_backend(name=None):
+    """Builds a backend by name; defaults to STORAGE_BACKEND, else S3 when configured, else local."""
+    name = (name or STORAGE_BACKEND or "").lower()
+    if not name:
+        name = "s3" if (S3_KEY and S3_SECRET and S3_BUCKET) else "local"
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown storage backend: {name}")
+    return BACKENDS[name]()
+
+def get_backend():
+    """Returns the process-wide storage backend selected from config."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend()
+                print(f"[SYSTEM] SkyStore backend: {_backend.name}")
+    return _backend
+
+def set_backend(backend):
+    """Overrides the process-wide backend (tests, benchmarks)."""
+    global _backend
+    _backend = backend
@@ -0,0 +1,176 @@
+"""
+Storage backend conformance checks.
+
+Runs the same contract checks against each StorageBackend implementation:
+
+    python -m cloud.conformance                # memory + local
+    python -m cloud.conformance s3             # needs S3_* config
+
+Point S3_ENDPOINT at a local S3 stand-in (MinIO, `moto_server`) to check the
+S3 backend without touching a real bucket. Exits non-zero on any failure.
+"""
+import sys
+import time
+import uuid
+import tempfile
+from .backends import create_backend, LocalBackend
+
+class _Abort(Exception):
+    pass
+
+def _failing_stream(chunks):
+    yield from chunks
+    raise _Abort("stream aborted")
+
+def check_roundtrip(backend, prefix):
+    key = f"{prefix}/a.bin"
+    backend.save(key, b"hello world")
+    assert backend.get(key) == b"hello world"
+
+def check_overwrite_changes_etag(backend, prefix):
+    key = f"{prefix}/b.bin"
+    backend.save(key, b"first")
+    before = backend.stat(key)
+    time.sleep(0.01)
+    backend.save(key, b"second!")
+    after = backend.stat(key)
+    assert backend.get(key) == b"second!"
+    assert after["size"] == 7
+    assert before["etag"] != after["etag"]
+
+def check_missing(backend, prefix):
+    key = f"{prefix}/missing.bin"
+    assert backend.get(key) is None
+    assert backend.stat(key) is None
+    assert backend.delete(key) is False
+    for args in ((), (0, 10)):
+        try:
+            b"".join(backend.iter_range(key, *args))
+        except FileNotFoundError:
+            continue
+        raise AssertionError(f"iter_range{args} on a missing key did not raise FileNotFoundError")
+
+def check_empty_object(backend, prefix):
+    key = f"{prefix}/empty.bin"
+    backend.save(key, b"")
+    assert backend.stat(key)["size"] == 0
+    assert backend.get(key) == b""
+
+def check_stream_and_ranges(backend, prefix):
+    key = f"{prefix}/c.bin"
+    data = bytes(range(256)) * 1024
+    backend.save_stream(key, (data[i:i + 10000] for i in range(0, len(data), 10000)))
+    assert backend.stat(key)["size"] == len(data)
+    assert b"".join(backend.iter_range(key)) == data
+    assert b"".join(backend.iter_range(key, 1000)) == data[1000:]
+    assert b"".join(backend.iter_range(key, 1000, 5000, chunk_size=777)) == data[1000:6000]
+    assert b"".join(backend.iter_range(key, len(data) - 3, 3)) == data[-3:]
+
+def check_large_object(backend, prefix):
+    # Crosses the multipart threshold on S3 (tune with S3_MULTIPART_THRESHOLD / S3_PART_SIZE)
+    key = f"{prefix}/large.bin"
+    size = getattr(backend, "multipart_threshold", 1024 * 1024) + getattr(backend, "part_size", 0) + 12345
+    block = bytes(range(256)) * 4096
+    data = (block * (size // len(block) + 1))[:size]
+    backend.save_stream(key, (data[i:i + 1024 * 1024] for i in range(0, size, 1024 * 1024)))
+    assert backend.stat(key)["size"] == size
+    assert b"".join(backend.iter_range(key)) == data
+    assert b"".join(backend.iter_range(key, 7, size - 14)) == data[7:-7]
+
+def check_failed_stream_leaves_nothing(backend, prefix):
+    key = f"{prefix}/partial.bin"
+    try:
+        backend.save_stream(key, _failing_stream([b"x" * 1000]))
+    except _Abort:
+        pass
+    assert backend.stat(key) is None
+    assert "partial.bin" not in backend.list(f"{prefix}/")
+
+def check_copy_and_move(backend, prefix):
+    data = bytes(range(256)) * 300
+    backend.save(f"{prefix}/src.bin", data)
+    assert backend.copy(f"{prefix}/src.bin", f"{prefix}/copy.bin") is True
+    assert backend.get(f"{prefix}/copy.bin") == data
+    assert backend.get(f"{prefix}/src.bin") == data
+    assert backend.move(f"{prefix}/copy.bin", f"{prefix}/moved.bin") is True
+    assert backend.stat(f"{prefix}/copy.bin") is None
+    assert backend.get(f"{prefix}/moved.bin") == data
+    backend.save(f"{prefix}/target.bin", b"old")
+    assert backend.move(f"{prefix}/moved.bin", f"{prefix}/target.bin") is True
+    assert backend.get(f"{prefix}/target.bin") == data
+    assert backend.copy(f"{prefix}/nope.bin", f"{prefix}/x.bin") is False
+    assert backend.move(f"{prefix}/nope.bin", f"{prefix}/x.bin") is False
+    assert backend.stat(f"{prefix}/x.bin") is None
+
+def check_large_copy(backend, prefix):
+    # Above the multipart threshold S3 switches to a multipart copy
+    key = f"{prefix}/large-src.bin"
+    size = getattr(backend, "multipart_threshold", 1024 * 1024) + 4321
+    data = (bytes(range(256)) * (size // 256 + 1))[:size]
+    backend.save_stream(key, (data[i:i + 1024 * 1024] for i in range(0, size, 1024 * 1024)))
+    assert backend.move(key, f"{prefix}/large-dst.bin") is True
+    assert backend.stat(key) is None
+    assert b"".join(backend.iter_range(f"{prefix}/large-dst.bin")) == data
+
+def check_list_and_delete(backend, prefix):
+    for name in ("one.txt", "two.txt"):
+        backend.save(f"{prefix}/list/{name}", b"x")
+    backend.save(f"{prefix}/list-other/three.txt", b"x")
+    # Nested keys are not part of the listing
+    backend.save(f"{prefix}/list/nested/four.txt", b"x")
+    assert sorted(backend.list(f"{prefix}/list/")) == ["one.txt", "two.txt"]
+    assert backend.delete(f"{prefix}/list/one.txt") is True
+    assert backend.list(f"{prefix}/list/") == ["two.txt"]
+
+CHECKS = [
+    check_roundtrip,
+    check_overwrite_changes_etag,
+    check_missing,
+    check_empty_object,
+    check_stream_and_ranges,
+    check_large_object,
+    check_failed_stream_leaves_nothing,
+    check_copy_and_move,
+    check_large_copy,
+    check_list_and_delete,
+]
+
+def _cleanup(backend, prefix):
+    for sub in ("", "list/", "list/nested/", "list-other/"):
+        for name in backend.list(f"{prefix}/{sub}"):
+            backend.delete(f"{prefix}/{sub}{name}")
+
+def run_checks(backend):
+    """Runs every check against `backend`; returns a list of (name, error) failures."""
+    prefix = f"conformance-{uuid.uuid4().hex[:8]}"
+    failures = []
+    try:
+        for check in CHECKS:
+            try:
+                check(backend, prefix)
+                print(f"  [PASS] {check.__name__}")
+            except Exception as e:
+                failures.append((check.__name__, e))
+                print(f"  [FAIL] {check.__name__}: {e!r}")
+    finally:
+        _cleanup(backend, prefix)
+    return failures
+
+def main(names):
+    failed = False
+    for name in names or ["memory", "local"]:
+        if name == "local":
+            backend = LocalBackend(tempfile.mkdtemp(prefix="cryptex-conformance-"))
+        else:
+            backend = create_backend(name)
+        if name == "s3":
+            try:
+                backend.client.head_bucket(Bucket=backend.bucket)
+            except Exception:
+                backend.client.create_bucket(Bucket=backend.bucket)
+        print(f"[CONFORMANCE] {name}")
+        failed = bool(run_checks(backend)) or failed
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,5 +1,4 @@
 import os
-import sqlite3
 from dotenv import load_dotenv
 
 # Load environment variables from .env if it exists
@@ -16,6 +15,9 @@ MAIL_PASSWORD = os.getenv("MAIL_PASSWORD", "offt uasp ydge lrlc")
 
 DB_NAME = os.getenv("DB_NAME", "cryptex.db")
 DATABASE_URL = os.getenv("DATABASE_URL") # For PostgreSQL in production
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 8))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", 256))
 
 # S3 Configuration
 S3_BUCKET = os.getenv("S3_BUCKET")
@@ -23,17 +25,69 @@ S3_KEY = os.getenv("S3_KEY")
 S3_SECRET = os.getenv("S3_SECRET")
 S3_REGION = os.getenv("S3_REGION", "us-east-1")
 S3_ENDPOINT = os.getenv("S3_ENDPOINT") # For S3-compatible services like DigitalOcean
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", 50))
+S3_MAX_ATTEMPTS = int(os.getenv("S3_MAX_ATTEMPTS", 3))
+S3_CONNECT_TIMEOUT = float(os.getenv("S3_CONNECT_TIMEOUT", 5))
+S3_READ_TIMEOUT = float(os.getenv("S3_READ_TIMEOUT", 60))
+# Large objects: multipart uploads and parallel ranged GETs above the threshold
+S3_MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD", 16 * 1024 * 1024))
+S3_PART_SIZE = int(os.getenv("S3_PART_SIZE", 8 * 1024 * 1024))
+S3_TRANSFER_CONCURRENCY = int(os.getenv("S3_TRANSFER_CONCURRENCY", 8))
+
+# Storage backend: "s3", "local" or "memory" (default: s3 if configured, else local)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND")
 
 UPLOAD_FOLDER = "uploads"
-MAX_CONTENT_LENGTH = 10 * 1024 * 1024
+MAX_CONTENT_LENGTH = int(os.getenv("MAX_CONTENT_LENGTH", 4 * 1024 * 1024 * 1024))
+
+# Vault: plaintext bytes per encrypted segment (bounds memory per stream)
+VAULT_CHUNK_SIZE = int(os.getenv("VAULT_CHUNK_SIZE", 64 * 1024))
+
+# User profile cache (is_admin, email, existence) in each process
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 4096))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 30))
+
+# Verified-token cache for jwt_required (re-checked after every revocation)
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+
+# File hashing: read buffer and LRU cache of digests keyed by (path, size, mtime, inode)
+HASH_BUFFER_SIZE = int(os.getenv("HASH_BUFFER_SIZE", 1024 * 1024))
+HASH_CACHE_SIZE = int(os.getenv("HASH_CACHE_SIZE", 1024))
+
+# Known-bad SHA-256 reputation index (built with `python -m improvise.reputation build`)
+REPUTATION_INDEX = os.getenv("REPUTATION_INDEX", "known_bad.idx")
+REPUTATION_RELOAD_INTERVAL = float(os.getenv("REPUTATION_RELOAD_INTERVAL", 5))
+
+# Audit log writer: events are queued and flushed in batches by a background thread
+AUDIT_ASYNC = os.getenv("AUDIT_ASYNC", "True") == "True"
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", 10000))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", 100))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", 0.5))
+AUDIT_OVERFLOW_POLICY = os.getenv("AUDIT_OVERFLOW_POLICY", "sync") # sync | block | drop
+# Every process publishes its writer metrics this often (table audit_sink_metrics) for the admin app
+AUDIT_METRICS_INTERVAL = float(os.getenv("AUDIT_METRICS_INTERVAL", 10))
+
+# OTP codes (engine/otpstore): Redis when USE_REDIS is set, else per-process memory
+OTP_TTL = int(os.getenv("OTP_TTL", 300))
+OTP_RESEND_INTERVAL = int(os.getenv("OTP_RESEND_INTERVAL", 60))
+OTP_MAX_ATTEMPTS = int(os.getenv("OTP_MAX_ATTEMPTS", 5))
+
+# Outbound mail: queued and delivered by background workers over persistent SMTP connections
+MAIL_ASYNC = os.getenv("MAIL_ASYNC", "True") == "True"
+MAIL_QUEUE_SIZE = int(os.getenv("MAIL_QUEUE_SIZE", 1000))
+MAIL_WORKERS = int(os.getenv("MAIL_WORKERS", 2))
+MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", 4))
+MAIL_RETRY_DELAY = float(os.getenv("MAIL_RETRY_DELAY", 1))
+MAIL_IDLE_TIMEOUT = float(os.getenv("MAIL_IDLE_TIMEOUT", 60))
+
+# Admin dashboard stats are cached this many seconds (the dashboard lags uploads by at most this)
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", 10))
+
+# Self-healing quarantine queue: one leader per deployment (DB lease) drains it
+QUARANTINE_CONCURRENCY = int(os.getenv("QUARANTINE_CONCURRENCY", 4))
+QUARANTINE_POLL_INTERVAL = float(os.getenv("QUARANTINE_POLL_INTERVAL", 2))
+QUARANTINE_MAX_ATTEMPTS = int(os.getenv("QUARANTINE_MAX_ATTEMPTS", 5))
+QUARANTINE_LEASE_TTL = int(os.getenv("QUARANTINE_LEASE_TTL", 30))
 
 USER_PORTAL_URL = os.getenv("USER_PORTAL_URL", "http://localhost:5000")
 ADMIN_PANEL_URL = os.getenv("ADMIN_PANEL_URL", "http://localhost:5001")
-
-def get_db():
-    if DATABASE_URL:
-        import psycopg2
-        from psycopg2.extras import RealDictCursor
-        conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
-        return conn
-    return sqlite3.connect(DB_NAME, timeout=10, check_same_thread=False)
\ No newline at end of file
@@ -1,21 +1,232 @@
+import os
+import re
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from config import DB_NAME, DATABASE_URL, DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_STATEMENT_CACHE
 
-DB_NAME = "cryptex.db"
+try:
+    import psycopg2
+    import psycopg2.extras
+    import psycopg2.pool
+except ImportError: # Only needed when DATABASE_URL is set
+    psycopg2 = None
+
+# SQLite locally, PostgreSQL when DATABASE_URL is set (multi-node deployments)
+DIALECT = "postgres" if DATABASE_URL else "sqlite"
+
+# Catch these instead of the driver-specific classes
+IntegrityError = (sqlite3.IntegrityError,) + ((psycopg2.IntegrityError,) if psycopg2 else ())
+OperationalError = (sqlite3.OperationalError,) + ((psycopg2.OperationalError,) if psycopg2 else ())
+
+_DDL_REWRITES = [
+    (re.compile(r"INTEGER PRIMARY KEY AUTOINCREMENT", re.I), "SERIAL PRIMARY KEY"),
+    (re.compile(r"\bDATETIME\b", re.I), "TIMESTAMP"),
+]
+_INSERT_OR_IGNORE = re.compile(r"^\s*INSERT\s+OR\s+IGNORE\s+INTO", re.I)
+
+@lru_cache(maxsize=512)
+def translate(sql):
+    """
+    Rewrites the SQLite dialect used throughout the app for PostgreSQL:
+    `?` placeholders, AUTOINCREMENT/DATETIME DDL and INSERT OR IGNORE.
+    (Write upserts as INSERT ... ON CONFLICT(...) DO UPDATE, which both accept.)
+    """
+    out = []
+    quoted = False
+    for ch in sql:
+        if ch == "'":
+            quoted = not quoted
+        if ch == "%":
+            out.append("%%")
+        elif ch == "?" and not quoted:
+            out.append("%s")
+        else:
+            out.append(ch)
+    sql = "".join(out)
+
+    for pattern, replacement in _DDL_REWRITES:
+        sql = pattern.sub(replacement, sql)
+    if _INSERT_OR_IGNORE.match(sql):
+        sql = _INSERT_OR_IGNORE.sub("INSERT INTO", sql).rstrip().rstrip(";") + " ON CONFLICT DO NOTHING"
+    return sql
+
+class PgConnection:
+    """Gives a psycopg2 connection the sqlite3-style `execute` API used by the app."""
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def execute(self, sql, params=()):
+        cur = self.raw.cursor()
+        cur.execute(translate(sql), tuple(params))
+        return cur
+
+    def executemany(self, sql, seq_of_params):
+        cur = self.raw.cursor()
+        cur.executemany(translate(sql), [tuple(p) for p in seq_of_params])
+        return cur
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+class _Pool:
+    """
+    Bounded connection pool shared by the threads of one process.
+    Subclasses provide _connect/_checkout/_checkin for their driver.
+    """
+
+    def __init__(self, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT):
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(size)
+        self._local = threading.local()
+
+    def _acquire(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError("database connection pool exhausted")
+        try:
+            return self._checkout()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _release(self, conn, broken=False):
+        try:
+            self._checkin(conn, broken)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """
+        Checks out a connection for one transaction: commit on success,
+        rollback on error. Nested use on the same thread joins the outer transaction.
+        """
+        outer = getattr(self._local, "conn", None)
+        if outer is not None:
+            yield outer
+            return
+
+        conn = self._acquire()
+        self._local.conn = conn
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+            raise
+        finally:
+            self._local.conn = None
+            self._release(conn, broken)
+
+class SQLitePool(_Pool):
+    """
+    SQLite connections in WAL mode with synchronous=NORMAL so readers never block
+    the writers, keeping their compiled statements cached between checkouts.
+    """
+
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._idle = queue.LifoQueue()
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        conn = sqlite3.connect(
+            self.path,
+            timeout=10,
+            check_same_thread=False,
+            cached_statements=DB_STATEMENT_CACHE
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _checkin(self, conn, broken):
+        if broken:
+            conn.close()
+        else:
+            self._idle.put(conn)
+
+class PostgresPool(_Pool):
+    """psycopg2 ThreadedConnectionPool behind the same blocking, bounded interface."""
+
+    def __init__(self, dsn, **kwargs):
+        super().__init__(**kwargs)
+        if psycopg2 is None:
+            raise RuntimeError("DATABASE_URL is set but psycopg2 is not installed")
+        self._pool = psycopg2.pool.ThreadedConnectionPool(
+            1, DB_POOL_SIZE, dsn, cursor_factory=psycopg2.extras.DictCursor
+        )
+
+    def _checkout(self):
+        return PgConnection(self._pool.getconn())
+
+    def _checkin(self, conn, broken):
+        self._pool.putconn(conn.raw, close=broken or bool(conn.raw.closed))
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Returns this process's pool (rebuilt after fork: DB handles must not cross processes)."""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = PostgresPool(DATABASE_URL) if DIALECT == "postgres" else SQLitePool(DB_NAME)
+                _pool_pid = pid
+    return _pool
 
 def get_db():
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Context manager yielding a pooled connection (see _Pool.connection)."""
+    return get_pool().connection()
+
+def add_column_if_missing(conn, table, column, definition):
+    """Idempotent ALTER TABLE ... ADD COLUMN for schema migrations on either dialect."""
+    if DIALECT == "postgres":
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {definition}")
+        return
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+def use_binary_collation(conn, table, column):
+    """
+    Makes comparisons and ordering on a TEXT column bytewise on PostgreSQL (COLLATE "C"),
+    as they are on SQLite, so range filters like db.prefix_range() match the same rows.
+    """
+    if DIALECT != "postgres":
+        return
+    row = conn.execute(
+        "SELECT collation_name FROM information_schema.columns WHERE table_name = ? AND column_name = ?",
+        (table, column)
+    ).fetchone()
+    if row is not None and row[0] != "C":
+        conn.execute(f'ALTER TABLE {table} ALTER COLUMN {column} TYPE TEXT COLLATE "C"')
 
 def init_db():
-    db = get_db()
-    db.execute("""
-        CREATE TABLE IF NOT EXISTS users(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL
-        )
-    """)
-    db.commit()
-    db.close()
+    with get_db() as db:
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS users(
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                password TEXT NOT NULL,
+                email TEXT UNIQUE NOT NULL
+            )
+        """)
@@ -1,9 +1,55 @@
 import jwt
+import time
+import hashlib
 from functools import wraps
 from flask import request, session
-from config import SECRET_KEY
-from .blacklist import is_jti_blacklisted
-from .gatekeeper import is_admin
+from config import SECRET_KEY, TOKEN_CACHE_SIZE
+from .blacklist import is_jti_blacklisted, blacklist_generation
+from .gatekeeper import is_admin, get_profile
+from .cache import LRUCache
+
+# ⚡ sha256(token) -> (payload, blacklist generation it was checked at); entries expire at the token's exp
+_verified = LRUCache(maxsize=TOKEN_CACHE_SIZE)
+
+class TokenRevoked(PermissionError):
+    """The token predates the user's current token generation, or the user is gone."""
+
+def _check_generation(payload):
+    profile = get_profile(payload["user"])
+    if not profile["exists"] or payload.get("gen", 0) != profile["token_generation"]:
+        raise TokenRevoked(payload["user"])
+
+def verify_token(token):
+    """
+    Returns the decoded payload of a valid, non-revoked token. Raises
+    jwt.InvalidTokenError (or ExpiredSignatureError), TokenRevoked if the
+    user's sessions were revoked, or PermissionError if blacklisted.
+    """
+    key = hashlib.sha256(token.encode()).digest()
+    generation = blacklist_generation()
+    cached = _verified.get(key)
+    if cached is not None:
+        payload, checked_at = cached
+        if payload["exp"] <= time.time():
+            _verified.pop(key)
+            raise jwt.ExpiredSignatureError("Signature has expired")
+        if checked_at == generation:
+            _check_generation(payload)
+            return payload
+        # Something was revoked since: only the blacklist needs re-checking
+    else:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+
+    jti = payload.get("jti")
+    if jti and is_jti_blacklisted(jti):
+        _verified.pop(key)
+        raise PermissionError(jti)
+
+    _check_generation(payload)
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)):
+        _verified.set(key, (payload, generation), ttl=exp - time.time())
+    return payload
 
 def jwt_required(f):
     @wraps(f)
@@ -27,14 +73,14 @@ def jwt_required(f):
             return {"error": "valid token missing"}, 401
 
         try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-            user = payload["user"]
-            jti = payload.get("jti")
-
-            # 🛑 Check Redis Blacklist
-            if jti and is_jti_blacklisted(jti):
-                return {"error": "token has been blacklisted (Intrusion Detected)"}, 401
+            user = verify_token(token)["user"]
 
+        # 🛑 All sessions of the user revoked (or account deleted)
+        except TokenRevoked:
+            return {"error": "token has been revoked"}, 401
+        # 🛑 Revoked through the Redis Blacklist
+        except PermissionError:
+            return {"error": "token has been blacklisted (Intrusion Detected)"}, 401
         except jwt.ExpiredSignatureError:
             return {"error": "token expired"}, 401
         except jwt.InvalidTokenError:
@@ -1,23 +1,47 @@
 import redis
 import os
+import json
+import time
+import threading
+from .cache import ExpiringSet
 
 # Redis connection configuration
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 REDIS_DB = int(os.getenv("REDIS_DB", 0))
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 16))
 
-# In-memory fallback for development without Redis
-memory_blacklist = set()
+KEY_PREFIX = "blacklist:"
+# Revocations are broadcast here as JSON [[jti, expires_at], ...]
+CHANNEL = "blacklist:revoked"
+# Usernames whose cached profile (and token generation) changed
+USERS_CHANNEL = "blacklist:users"
+
+# ⚡ Local tier: every revoked JTI with its expiry, checked without a round trip.
+# Without Redis it is the whole blacklist (per process, as before).
+memory_blacklist = ExpiringSet()
+
+# Generation: bumped on every revocation so caches of verified tokens know to re-check
+_generation = 0
+_generation_lock = threading.Lock()
+
+# The local tier is only authoritative while the listener is subscribed and has loaded Redis
+_synced = threading.Event()
+_listener_pid = None
+_listener_lock = threading.Lock()
+_user_callbacks = []
 
 try:
     if os.getenv("USE_REDIS", "False").lower() == "true":
-        redis_client = redis.StrictRedis(
-            host=REDIS_HOST, 
-            port=REDIS_PORT, 
-            db=REDIS_DB, 
+        redis_pool = redis.ConnectionPool(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            db=REDIS_DB,
             decode_responses=True,
-            socket_connect_timeout=1
+            socket_connect_timeout=1,
+            max_connections=REDIS_MAX_CONNECTIONS
         )
+        redis_client = redis.StrictRedis(connection_pool=redis_pool)
         # Test connection immediately
         redis_client.ping()
         print("[SYSTEM] Connected to Redis Blacklist.")
@@ -27,34 +51,150 @@ except Exception:
     print("[WARNING] Redis connection failed or not configured. Falling back to in-memory blacklist.")
     redis_client = None
 
+def _bump_generation():
+    global _generation
+    with _generation_lock:
+        _generation += 1
+
+def _remember(entries):
+    for jti, expires_at in entries:
+        memory_blacklist.add(jti, expires_at)
+    _bump_generation()
+
+def _user_changed(username):
+    for callback in _user_callbacks:
+        callback(username)
+    _bump_generation()
+
+def _load_snapshot():
+    """Copies every live Redis revocation into the local tier."""
+    keys = list(redis_client.scan_iter(match=f"{KEY_PREFIX}*", count=1000))
+    if not keys:
+        return 0
+    pipe = redis_client.pipeline(transaction=False)
+    for key in keys:
+        pipe.pttl(key)
+    now = time.time()
+    entries = [
+        (key[len(KEY_PREFIX):], now + ttl / 1000)
+        for key, ttl in zip(keys, pipe.execute())
+        if ttl and ttl > 0
+    ]
+    _remember(entries)
+    return len(entries)
+
+def _listen():
+    """Keeps the local tier in sync with Redis; reconnects with backoff."""
+    delay = 0.5
+    while True:
+        pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        try:
+            # Subscribe before loading so nothing revoked in between is missed
+            pubsub.subscribe(CHANNEL, USERS_CHANNEL)
+            loaded = _load_snapshot()
+            # User changes published while disconnected were missed: drop them all
+            _user_changed(None)
+            _synced.set()
+            print(f"[BLACKLIST] Listening for revocations ({loaded} loaded).")
+            delay = 0.5
+            for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                if message["channel"] == USERS_CHANNEL:
+                    _user_changed(message["data"])
+                else:
+                    _remember(json.loads(message["data"]))
+        except Exception as e:
+            _synced.clear()
+            _bump_generation()
+            print(f"[WARNING] Blacklist listener lost Redis: {e}. Retrying in {delay:.1f}s.")
+            time.sleep(delay)
+            delay = min(delay * 2, 30)
+        finally:
+            try:
+                pubsub.close()
+            except Exception:
+                pass
+
+def _ensure_listener():
+    # One listener per process: gunicorn workers fork after import
+    global _listener_pid
+    if redis_client is None or _listener_pid == os.getpid():
+        return
+    with _listener_lock:
+        if _listener_pid != os.getpid():
+            _synced.clear()
+            threading.Thread(target=_listen, daemon=True).start()
+            _listener_pid = os.getpid()
+
+def blacklist_jtis(jtis, expiration=3600):
+    """Revokes several JTIs with one pipelined round trip and one broadcast."""
+    expires_at = time.time() + expiration
+    entries = [(jti, expires_at) for jti in jtis]
+    if not entries:
+        return True
+    _remember(entries)
+    if redis_client:
+        try:
+            pipe = redis_client.pipeline()
+            for jti, _ in entries:
+                pipe.setex(f"{KEY_PREFIX}{jti}", expiration, "true")
+            pipe.publish(CHANNEL, json.dumps(entries))
+            pipe.execute()
+        except Exception as e:
+            print(f"[WARNING] Redis revocation failed: {e}. Kept in memory only.")
+    return True
+
 def blacklist_jti(jti, expiration=3600):
     """Adds a JTI to the blacklist."""
+    return blacklist_jtis([jti], expiration)
+
+def on_user_change(callback):
+    """
+    Registers callback(username), run in every process when publish_user_change()
+    is called, and with None (any user) after the Redis listener reconnects.
+    """
+    _user_callbacks.append(callback)
+
+def publish_user_change(username):
+    """Tells every process (through Redis, if configured) that a user's record changed."""
+    _user_changed(username)
     if redis_client:
         try:
-            redis_client.setex(f"blacklist:{jti}", expiration, "true")
-            return True
-        except Exception:
-            pass
-    
-    memory_blacklist.add(jti)
-    return True
+            redis_client.publish(USERS_CHANNEL, username)
+        except Exception as e:
+            print(f"[WARNING] Redis publish failed: {e}.")
+
+def blacklist_generation():
+    """
+    Changes whenever a token is revoked in this process or broadcast through
+    Redis. While the Redis listener is not in sync, it changes on every call.
+    """
+    _ensure_listener()
+    if redis_client and not _synced.is_set():
+        return object()
+    return _generation
 
 def is_jti_blacklisted(jti):
 
     """Checks if a JTI is present in the blacklist."""
 
-    if redis_client:
+    if jti in memory_blacklist:
 
-        try:
+        return True
 
-            if redis_client.exists(f"blacklist:{jti}"):
+    _ensure_listener()
 
-                return True
+    if redis_client and not _synced.is_set():
+
+        # Listener not caught up yet: ask Redis directly
+
+        try:
+
+            return bool(redis_client.exists(f"{KEY_PREFIX}{jti}"))
 
         except Exception as e:
 
             print(f"[WARNING] Redis check failed: {e}. Falling back to memory check.")
 
-            
-
-    return jti in memory_blacklist
+    return False
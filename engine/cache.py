@@ -0,0 +1,97 @@
+import time
+import heapq
+import threading
+from collections import OrderedDict
+
+_MISSING = object()
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with an optional per-entry TTL (seconds).
+    Least recently used entries are evicted once `maxsize` is reached.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                value, expires_at = item
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        """Stores `value`; `ttl` overrides the cache default for this entry."""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            item = self._data.pop(key, None)
+        return item[0] if item else None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+class ExpiringSet:
+    """
+    Thread-safe set whose members expire at an absolute wall-clock time
+    (so expiry times can be shared between processes). Expired members are
+    dropped lazily from a min-heap of expiry times.
+    """
+
+    def __init__(self):
+        self._expires = {}
+        self._heap = []
+        self._lock = threading.Lock()
+
+    def _purge(self, now):
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            expires_at, member = heapq.heappop(heap)
+            # Re-added members keep a newer entry further down the heap
+            if self._expires.get(member) == expires_at:
+                del self._expires[member]
+
+    def add(self, member, expires_at):
+        with self._lock:
+            self._purge(time.time())
+            if expires_at > self._expires.get(member, 0):
+                self._expires[member] = expires_at
+                heapq.heappush(self._heap, (expires_at, member))
+
+    def __contains__(self, member):
+        with self._lock:
+            expires_at = self._expires.get(member)
+            return expires_at is not None and expires_at > time.time()
+
+    def __len__(self):
+        with self._lock:
+            self._purge(time.time())
+            return len(self._expires)
@@ -1,147 +1,139 @@
-import sqlite3
 import secrets
-import time
 from werkzeug.security import generate_password_hash, check_password_hash
+from database import get_db, add_column_if_missing, IntegrityError
+from config import USER_CACHE_SIZE, USER_CACHE_TTL
+from .cache import LRUCache
+from .blacklist import on_user_change, publish_user_change
+from .otpstore import issue_otp, consume_otp, discard_otp
 
-DB = "cryptex.db"
-
-def get_db():
-    return sqlite3.connect(DB, timeout=10, check_same_thread=False)
+# ⚡ username -> {"exists", "email", "is_admin", "token_generation"}; call invalidate_user() after changing a user
+_profiles = LRUCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+# Unknown users are remembered briefly: they may be registered through another process
+NEGATIVE_TTL = min(USER_CACHE_TTL, 5)
 
 def init_users():
-    conn = get_db()
-    try:
+    with get_db() as conn:
         conn.execute("""
             CREATE TABLE IF NOT EXISTS users (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 username TEXT UNIQUE,
                 password TEXT,
                 email TEXT,
+                -- Unused: OTP state lives in engine/otpstore
                 otp TEXT,
                 otp_time INTEGER,
                 last_otp_sent INTEGER DEFAULT 0,
-                is_admin INTEGER DEFAULT 0
+                is_admin INTEGER DEFAULT 0,
+                token_generation INTEGER DEFAULT 0
             )
         """)
         # Migration: add is_admin if it doesn't exist
-        try:
-            conn.execute("ALTER TABLE users ADD COLUMN is_admin INTEGER DEFAULT 0")
-        except sqlite3.OperationalError:
-            pass
-        conn.commit()
-    finally:
-        conn.close()
+        add_column_if_missing(conn, "users", "is_admin", "INTEGER DEFAULT 0")
+        # Migration: per-user token generation (bumping it revokes every session)
+        add_column_if_missing(conn, "users", "token_generation", "INTEGER DEFAULT 0")
+
+def get_profile(username):
+    """Cached profile of a user (unknown users are cached as not existing)."""
+    profile = _profiles.get(username)
+    if profile is None:
+        with get_db() as conn:
+            row = conn.execute(
+                "SELECT email, is_admin, token_generation FROM users WHERE username=?", (username,)
+            ).fetchone()
+        profile = {
+            "exists": row is not None,
+            "email": row[0] if row else None,
+            "is_admin": bool(row and row[1] == 1),
+            "token_generation": (row[2] or 0) if row else None
+        }
+        _profiles.set(username, profile, ttl=None if row else NEGATIVE_TTL)
+    return profile
+
+def _drop_profile(username):
+    if username is None:
+        _profiles.clear()
+    else:
+        _profiles.pop(username)
+
+on_user_change(_drop_profile)
+
+def invalidate_user(username):
+    """
+    Drops a user's cached profile. With Redis, every process drops it at once;
+    otherwise other processes see the change within USER_CACHE_TTL.
+    """
+    publish_user_change(username)
+
+def current_token_generation(username):
+    """Token generation read from the database (for issuing tokens), or None for unknown users."""
+    with get_db() as conn:
+        row = conn.execute(
+            "SELECT token_generation FROM users WHERE username=?", (username,)
+        ).fetchone()
+    return (row[0] or 0) if row else None
+
+def revoke_tokens(username):
+    """Invalidates every token issued to the user so far with one counter bump."""
+    with get_db() as conn:
+        conn.execute(
+            "UPDATE users SET token_generation = COALESCE(token_generation, 0) + 1 WHERE username=?",
+            (username,)
+        )
+    invalidate_user(username)
 
 def is_admin(username):
-    conn = get_db()
-    try:
-        cur = conn.execute("SELECT is_admin FROM users WHERE username=?", (username,))
-        row = cur.fetchone()
-        return row and row[0] == 1
-    finally:
-        conn.close()
+    return get_profile(username)["is_admin"]
 
 def register_user(username, password, email):
-    conn = get_db()
     try:
-        conn.execute(
-            "INSERT INTO users (username, password, email) VALUES (?, ?, ?)",
-            (username, generate_password_hash(password), email)
-        )
-        conn.commit()
+        with get_db() as conn:
+            conn.execute(
+                "INSERT INTO users (username, password, email, token_generation) VALUES (?, ?, ?, ?)",
+                # Random start, so tokens of a deleted account with the same name don't match
+                (username, generate_password_hash(password), email, secrets.randbelow(2 ** 30))
+            )
+        invalidate_user(username)
         return True
-    except sqlite3.IntegrityError:
+    except IntegrityError:
         # Username or Email already exists
         return False
-    finally:
-        conn.close()
 
 def verify_user(username, password):
-    conn = get_db()
-    try:
+    if not get_profile(username)["exists"]:
+        return False
+    with get_db() as conn:
         cur = conn.execute(
             "SELECT password FROM users WHERE username=?", (username,)
         )
         row = cur.fetchone()
         return row and check_password_hash(row[0], password)
-    finally:
-        conn.close()
 
 def generate_otp(username):
-    conn = get_db()
-    try:
-        cur = conn.execute(
-            "SELECT last_otp_sent FROM users WHERE username=?", (username,)
-        )
-        row = cur.fetchone()
+    # Secure OTP generation
+    otp = str(secrets.randbelow(900000) + 100000)
 
-        last_sent = row[0] if row and row[0] else 0
-        now = int(time.time())
+    # ⛔ 1 OTP per OTP_RESEND_INTERVAL (60 seconds), ⏱ valid OTP_TTL (5 minutes)
+    if not issue_otp(username, otp):
+        return None
 
-        # ⛔ 1 OTP per 60 seconds
-        if now - last_sent < 60:
-            return None
+    return otp
 
-        # Secure OTP generation
-        otp = str(secrets.randbelow(900000) + 100000)
-
-        conn.execute("""
-            UPDATE users
-            SET otp=?, otp_time=?, last_otp_sent=?
-            WHERE username=?
-        """, (otp, now, now, username))
-
-        conn.commit()
-        return otp
-    finally:
-        conn.close()
+def cancel_otp(username):
+    """Withdraws an OTP that was never delivered, so the user can request another at once."""
+    discard_otp(username)
 
 def verify_otp(username, code):
-    conn = get_db()
-    try:
-        cur = conn.execute(
-            "SELECT otp, otp_time FROM users WHERE username=?", (username,)
-        )
-        row = cur.fetchone()
-
-        if not row or not row[0]:
-            return False
-
-        otp, ts = row
-
-        # ⏱ valid 5 minutes
-        if int(time.time()) - ts > 300:
-            return False
-
-        if otp == code:
-            # ✅ Clear OTP after success to prevent reuse
-            conn.execute(
-                "UPDATE users SET otp=NULL, otp_time=NULL WHERE username=?",
-                (username,)
-            )
-            conn.commit()
-            return True
-        
-        return False
-    finally:
-        conn.close()
+    # ✅ Consumed on success to prevent reuse
+    return consume_otp(username, code)
 
 def get_email(username):
-    conn = get_db()
-    try:
-        cur = conn.execute("SELECT email FROM users WHERE username=?", (username,))
-        row = cur.fetchone()
-        return row[0] if row else None
-    finally:
-        conn.close()
+    return get_profile(username)["email"]
 
 def delete_user_db(username):
-    conn = get_db()
     try:
-        conn.execute("DELETE FROM users WHERE username=?", (username,))
-        conn.commit()
+        with get_db() as conn:
+            conn.execute("DELETE FROM users WHERE username=?", (username,))
+        invalidate_user(username)
         return True
     except:
         return False
-    finally:
-        conn.close()
@@ -0,0 +1,131 @@
+import hmac
+import time
+import redis
+import threading
+from config import OTP_TTL, OTP_RESEND_INTERVAL, OTP_MAX_ATTEMPTS
+from .blacklist import redis_client
+
+# Keys: the code itself, wrong guesses against it, and the resend cooldown
+CODE_KEY = "otp:code:{}"
+TRIES_KEY = "otp:tries:{}"
+SENT_KEY = "otp:sent:{}"
+
+# KEYS: code, tries | ARGV: guess, max attempts, ttl
+# Returns 1 and deletes the code on a match; a wrong guess counts towards the limit
+_CONSUME_SCRIPT = """
+local code = redis.call('GET', KEYS[1])
+if not code then return 0 end
+if code == ARGV[1] then
+    redis.call('DEL', KEYS[1], KEYS[2])
+    return 1
+end
+local tries = redis.call('INCR', KEYS[2])
+if tries == 1 then redis.call('EXPIRE', KEYS[2], ARGV[3]) end
+if tries >= tonumber(ARGV[2]) then redis.call('DEL', KEYS[1], KEYS[2]) end
+return 0
+"""
+
+class RedisOTPStore:
+    """OTP codes in Redis with native expiry, shared by every worker."""
+
+    def __init__(self, client):
+        self.client = client
+        self._consume = client.register_script(_CONSUME_SCRIPT)
+
+    def issue(self, username, code):
+        # SET NX doubles as the resend limit: only one code per OTP_RESEND_INTERVAL
+        if not self.client.set(SENT_KEY.format(username), 1, nx=True, ex=OTP_RESEND_INTERVAL):
+            return False
+        pipe = self.client.pipeline()
+        pipe.set(CODE_KEY.format(username), code, ex=OTP_TTL)
+        pipe.delete(TRIES_KEY.format(username))
+        pipe.execute()
+        return True
+
+    def discard(self, username):
+        self.client.delete(CODE_KEY.format(username), TRIES_KEY.format(username), SENT_KEY.format(username))
+
+    def consume(self, username, code):
+        keys = [CODE_KEY.format(username), TRIES_KEY.format(username)]
+        return self._consume(keys=keys, args=[code, OTP_MAX_ATTEMPTS, OTP_TTL]) == 1
+
+class MemoryOTPStore:
+    """
+    Per-process fallback without Redis. A code only verifies in the worker that
+    issued it, so run a single worker (the Procfile default) or enable Redis.
+    """
+
+    def __init__(self):
+        self._codes = {}  # username -> [code, expires_at, wrong guesses]
+        self._sent = {}   # username -> time the next code may be issued
+        self._lock = threading.Lock()
+
+    def _purge(self, now):
+        self._codes = {user: entry for user, entry in self._codes.items() if entry[1] > now}
+        self._sent = {user: until for user, until in self._sent.items() if until > now}
+
+    def issue(self, username, code):
+        now = time.time()
+        with self._lock:
+            if self._sent.get(username, 0) > now:
+                return False
+            if len(self._sent) >= 1024:
+                self._purge(now)
+            self._sent[username] = now + OTP_RESEND_INTERVAL
+            self._codes[username] = [code, now + OTP_TTL, 0]
+            return True
+
+    def discard(self, username):
+        with self._lock:
+            self._codes.pop(username, None)
+            self._sent.pop(username, None)
+
+    def consume(self, username, code):
+        with self._lock:
+            entry = self._codes.get(username)
+            if entry is None or entry[1] <= time.time():
+                self._codes.pop(username, None)
+                return False
+            if hmac.compare_digest(entry[0].encode(), code.encode()):
+                del self._codes[username]
+                return True
+            entry[2] += 1
+            if entry[2] >= OTP_MAX_ATTEMPTS:
+                del self._codes[username]
+            return False
+
+otp_store = RedisOTPStore(redis_client) if redis_client else None
+# The whole store without Redis; takes over while Redis is unreachable, like the blacklist's memory tier
+fallback_store = MemoryOTPStore()
+
+def issue_otp(username, code):
+    """Stores a new code for the user; False if one was issued less than OTP_RESEND_INTERVAL ago."""
+    if otp_store:
+        try:
+            return otp_store.issue(username, code)
+        except redis.RedisError as e:
+            print(f"[WARNING] Redis OTP store failed: {e}. Falling back to memory.")
+    return fallback_store.issue(username, code)
+
+def discard_otp(username):
+    """Withdraws the user's code and resend cooldown (e.g. when it could not be sent)."""
+    if otp_store:
+        try:
+            otp_store.discard(username)
+        except redis.RedisError as e:
+            print(f"[WARNING] Redis OTP discard failed: {e}.")
+    fallback_store.discard(username)
+
+def consume_otp(username, code):
+    """Atomically checks the code and burns it on success (or after OTP_MAX_ATTEMPTS wrong guesses)."""
+    if not code:
+        return False
+    code = str(code)
+    if otp_store:
+        try:
+            if otp_store.consume(username, code):
+                return True
+        except redis.RedisError as e:
+            print(f"[WARNING] Redis OTP check failed: {e}. Falling back to memory.")
+    # Codes issued while Redis was down only exist in memory
+    return fallback_store.consume(username, code)
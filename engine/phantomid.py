@@ -2,12 +2,15 @@ import jwt
 import datetime
 import uuid
 from config import SECRET_KEY
+from .gatekeeper import current_token_generation
 
 def generate_dynamic_id(username):
     now = datetime.datetime.now(datetime.timezone.utc)
     payload = {
         "user": username,
         "jti": str(uuid.uuid4()),
+        # Bumped by revoke_tokens() to invalidate every session of the user
+        "gen": current_token_generation(username) or 0,
         "iat": now,
         "exp": now + datetime.timedelta(minutes=30)
     }
@@ -1,28 +1,14 @@
-import os
 from werkzeug.utils import secure_filename
-
-BASE_UPLOAD_DIR = "uploads"
-
-
-def get_user_dir(username):
-    """
-    Returns the directory path for a user.
-    Creates it if it does not exist.
-    """
-    user_dir = os.path.join(BASE_UPLOAD_DIR, username)
-    os.makedirs(user_dir, exist_ok=True)
-    return user_dir
+from cloud.skystore import SkyStore
+from cloud.backends import get_backend
 
 
 def save_file(username, file):
     """
-    Save uploaded file securely for a user
+    Save uploaded file for a user through the configured storage backend
     """
     filename = secure_filename(file.filename)
-    user_dir = get_user_dir(username)
-    path = os.path.join(user_dir, filename)
-
-    file.save(path)
+    SkyStore.save_stream(username, filename, iter(lambda: file.stream.read(64 * 1024), b""))
     return filename
 
 
@@ -30,12 +16,14 @@ def list_files(username):
     """
     List all files belonging to a user
     """
-    user_dir = get_user_dir(username)
-    return os.listdir(user_dir)
+    return SkyStore.list_files(username)
 
 
 def file_path(username, filename):
     """
-    Get full file path for download
+    Get full file path for download (local backend only, else None)
     """
-    return os.path.join(get_user_dir(username), filename)
+    backend = get_backend()
+    if hasattr(backend, "path"):
+        return backend.path(SkyStore.key(username, filename))
+    return None
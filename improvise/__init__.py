@@ -3,6 +3,12 @@ from .vault import Vault
 from .ai_analyzer import AIAnalyzer
 from .audit import AuditLogger
 from .security import SecurityHarden
+from .stats import StatsEngine
+from .blobstore import BlobStore
+from .file_index import FileIndex
+from .pipeline import (
+    MultipartFileReader, UploadPipeline, UploadTooLarge, ContentHashMismatch, KnownBadContent, DownloadStream
+)
 from .self_healing import start_self_healing
 
 def bootstrap_improvements():
@@ -1,7 +1,12 @@
 import os
-import hashlib
 # import magic # Requires python-magic
 from .db import get_db_context
+from .self_healing import QuarantineQueue, QUARANTINE_THRESHOLD
+from .blobstore import BlobStore
+from .hashing import file_digest
+from . import reputation
+from . import sniffer
+from cloud.skystore import SkyStore
 
 class AIAnalyzer:
     """The Cryptex AI Engine: Analyzes files for risks and metadata anomalies."""
@@ -10,23 +15,25 @@ class AIAnalyzer:
     
     @staticmethod
     def calculate_hash(file_path):
-        sha256_hash = hashlib.sha256()
-        with open(file_path, "rb") as f:
-            for byte_block in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(byte_block)
-        return sha256_hash.hexdigest()
+        """SHA-256 of a file on disk (cached while the file is unchanged)."""
+        return file_digest(file_path)
 
     @staticmethod
-    def analyze_file(file_path, filename, username):
-        if not os.path.exists(file_path):
-            return {
-                "risk_score": 0,
-                "analysis": "File not found for analysis.",
-                "safe": True
-            }
+    def is_known_bad(file_hash):
+        """True if the hash is in the reputation index or identical content was quarantined."""
+        if reputation.is_known_bad(file_hash):
+            return True
+        with get_db_context() as db:
+            row = db.execute("""
+                SELECT 1 FROM file_metadata
+                WHERE file_hash = ? AND is_active = 0 AND risk_score > ?
+                LIMIT 1
+            """, (file_hash, QUARANTINE_THRESHOLD)).fetchone()
+        return row is not None
 
-        file_size = os.path.getsize(file_path)
-        file_hash = AIAnalyzer.calculate_hash(file_path)
+    @staticmethod
+    def score(filename, file_size, file_hash=None, mime_type=None):
+        """Pure risk scoring: returns (risk_score, reasons) without touching the DB."""
         ext = os.path.splitext(filename)[1].lower()
         
         risk_score = 0
@@ -42,21 +49,91 @@ class AIAnalyzer:
             risk_score += 20
             reasons.append("Large file size for standard document")
 
-        # 3. Mime-type mismatch (Simulated AI Check)
-        # In a real scenario, we'd use 'magic' to check if content matches extension
-        # risk_score += 30 (if mismatch)
+        # 3. Known-malicious content (memory-mapped reputation index, no DB or network)
+        if file_hash and reputation.is_known_bad(file_hash):
+            risk_score += 100
+            reasons.append("Hash matches known-malicious file")
 
+        # 4. Mime-type mismatch (content sniffed from the first few KB)
+        mismatch_risk, mismatch_reason = sniffer.mismatch(filename, mime_type)
+        if mismatch_risk:
+            risk_score += mismatch_risk
+            reasons.append(mismatch_reason)
+
+        return risk_score, reasons
+
+    @staticmethod
+    def analyze_upload(filename, username, file_size, file_hash, storage_key=None, mime_type=None):
+        """
+        Scores an upload from inputs gathered by the streaming pipeline and records it.
+        `storage_key` is the blob now holding the file; the one it replaces is released.
+        """
+        risk_score, reasons = AIAnalyzer.score(filename, file_size, file_hash, mime_type)
         analysis_summary = "; ".join(reasons) if reasons else "File appears safe."
         
         # Save analysis to DB
-        with get_db_context() as db:
-            db.execute("""
-                INSERT OR REPLACE INTO file_metadata (file_hash, filename, owner, size, risk_score, ai_analysis, is_active)
-                VALUES (?, ?, ?, ?, ?, ?, 1)
-            """, (file_hash, filename, username, file_size, risk_score, analysis_summary))
+        try:
+            with get_db_context() as db:
+                cur = db.execute("""
+                    INSERT INTO file_metadata (file_hash, filename, owner, size, mime_type, risk_score, ai_analysis, is_active, storage_key)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?)
+                    ON CONFLICT(owner, filename) DO NOTHING
+                """, (file_hash, filename, username, file_size, mime_type, risk_score, analysis_summary, storage_key))
+                previous = None
+                if cur.rowcount != 1:
+                    # Lock the existing row before reading the key it holds (SQLite: the
+                    # INSERT already took the write lock), so two re-uploads of the same
+                    # file cannot both read, and both release, the same old blob
+                    db.execute(
+                        "UPDATE file_metadata SET is_active = is_active WHERE owner = ? AND filename = ?",
+                        (username, filename)
+                    )
+                    previous = db.execute(
+                        "SELECT storage_key FROM file_metadata WHERE owner = ? AND filename = ?", (username, filename)
+                    ).fetchone()
+                    db.execute("""
+                        UPDATE file_metadata SET
+                            file_hash = ?,
+                            size = ?,
+                            mime_type = ?,
+                            risk_score = ?,
+                            ai_analysis = ?,
+                            is_active = 1,
+                            storage_key = COALESCE(?, storage_key),
+                            upload_time = CURRENT_TIMESTAMP
+                        WHERE owner = ? AND filename = ?
+                    """, (file_hash, file_size, mime_type, risk_score, analysis_summary, storage_key, username, filename))
+                # Hand critical files to the self-healing worker in the same transaction
+                if risk_score > QUARANTINE_THRESHOLD:
+                    QuarantineQueue.enqueue(username, filename, risk_score, db=db)
+        except Exception:
+            # The row never took the reference the pipeline committed for it
+            BlobStore.release(storage_key)
+            raise
+        if storage_key:
+            if previous is None or previous["storage_key"] is None:
+                # Replaces a legacy "<owner>/<filename>" object, if there is one
+                SkyStore.delete_file(username, filename)
+            else:
+                # The row held its own reference, even when the content (and so the blob) is unchanged
+                BlobStore.release(previous["storage_key"])
             
         return {
             "risk_score": risk_score,
             "analysis": analysis_summary,
             "safe": risk_score < 70
         }
+
+    @staticmethod
+    def analyze_file(file_path, filename, username):
+        if not os.path.exists(file_path):
+            return {
+                "risk_score": 0,
+                "analysis": "File not found for analysis.",
+                "safe": True
+            }
+
+        file_size = os.path.getsize(file_path)
+        file_hash = AIAnalyzer.calculate_hash(file_path)
+        mime_type = sniffer.sniff_file(file_path)
+        return AIAnalyzer.analyze_upload(filename, username, file_size, file_hash, mime_type=mime_type)
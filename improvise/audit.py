@@ -1,27 +1,356 @@
+import os
+import json
+import time
+import queue
+import atexit
+import socket
+import threading
+from datetime import datetime, timezone
 from flask import request
-from .db import get_db_context
+from config import (
+    AUDIT_ASYNC, AUDIT_QUEUE_SIZE, AUDIT_BATCH_SIZE, AUDIT_FLUSH_INTERVAL, AUDIT_OVERFLOW_POLICY,
+    AUDIT_METRICS_INTERVAL
+)
+from .db import get_db_context, prefix_range, db_time
+
+_STOP = object()
+
+def _serialize_log(row):
+    log = dict(row)
+    log["timestamp"] = db_time(log["timestamp"])
+    return log
+
+def action_type(action):
+    """The part of an action before ":" ("upload:report.pdf" -> "upload")."""
+    return action.partition(":")[0]
+
+def _write_rows(rows):
+    """Inserts audit rows as one multi-row INSERT in a single transaction."""
+    placeholders = ", ".join(["(?, ?, ?, ?, ?, ?)"] * len(rows))
+    params = [value for row in rows for value in row + (action_type(row[2]),)]
+    with get_db_context() as db:
+        db.execute(f"""
+            INSERT INTO audit_logs (timestamp, username, action, status, ip_address, action_type)
+            VALUES {placeholders}
+        """, params)
+
+def _first_id_at(db, timestamp):
+    """Id of the first row logged at or after `timestamp` (one seek on the timestamp index)."""
+    row = db.execute(
+        "SELECT id FROM audit_logs WHERE timestamp >= ? ORDER BY timestamp, id LIMIT 1", (timestamp,)
+    ).fetchone()
+    return row["id"] if row else None
+
+def _summarize(stats):
+    """Turns the raw counters of a sink into the reported metrics (average instead of total flush time)."""
+    stats = dict(stats)
+    stats["avg_flush_ms"] = stats["total_flush_ms"] / stats["flushes"] if stats["flushes"] else 0.0
+    del stats["total_flush_ms"]
+    return stats
+
+class AuditSink:
+    """
+    Background audit writer. Request threads enqueue events into a bounded
+    queue; one worker flushes them in batched transactions once `batch_size`
+    events are waiting or `flush_interval` seconds have passed.
+
+    Overflow policy when the queue is full:
+      "sync"  - write the event inline (never loses an event; default)
+      "block" - wait up to `flush_interval` for room, then drop
+      "drop"  - drop the event immediately
+
+    Every `metrics_interval` seconds the worker publishes its metrics to the
+    audit_sink_metrics table, where the admin app sums up all processes.
+    """
+
+    def __init__(self, max_queue=AUDIT_QUEUE_SIZE, batch_size=AUDIT_BATCH_SIZE,
+                 flush_interval=AUDIT_FLUSH_INTERVAL, overflow=AUDIT_OVERFLOW_POLICY,
+                 metrics_interval=AUDIT_METRICS_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.metrics_interval = metrics_interval
+        self.process = f"{socket.gethostname()}:{os.getpid()}"
+        self._next_publish = 0.0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "enqueued": 0,
+            "written": 0,
+            "dropped": 0,
+            "overflow_sync_writes": 0,
+            "failed": 0,
+            "flushes": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+        }
+        self._worker = threading.Thread(target=self._run, name="audit-sink", daemon=True)
+        self._worker.start()
+
+    def _bump(self, **deltas):
+        with self._stats_lock:
+            for key, value in deltas.items():
+                self._stats[key] += value
+
+    def submit(self, row):
+        """Queues one (timestamp, username, action, status, ip) row. Returns False if dropped."""
+        try:
+            self._queue.put_nowait(row)
+            self._bump(enqueued=1)
+            return True
+        except queue.Full:
+            pass
+
+        if self.overflow == "block":
+            try:
+                self._queue.put(row, timeout=self.flush_interval)
+                self._bump(enqueued=1)
+                return True
+            except queue.Full:
+                pass
+        elif self.overflow == "sync":
+            self._flush_batch([row])
+            self._bump(overflow_sync_writes=1)
+            return True
+
+        self._bump(dropped=1)
+        return False
+
+    def _flush_batch(self, rows):
+        started = time.perf_counter()
+        for attempt in range(3):
+            try:
+                _write_rows(rows)
+                break
+            except Exception as e:
+                print(f"[AUDIT ERROR] Flush of {len(rows)} events failed (attempt {attempt + 1}): {e}")
+                time.sleep(0.1 * (attempt + 1))
+        else:
+            self._bump(failed=len(rows))
+            return
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._stats_lock:
+            self._stats["written"] += len(rows)
+            self._stats["flushes"] += 1
+            self._stats["last_flush_ms"] = elapsed_ms
+            self._stats["total_flush_ms"] += elapsed_ms
+            self._stats["max_flush_ms"] = max(self._stats["max_flush_ms"], elapsed_ms)
+
+    def _raw_stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["queue_capacity"] = self._queue.maxsize
+        return stats
+
+    def _publish(self):
+        """Stores this process's metrics for the admin app and drops those of processes gone quiet."""
+        now = int(time.time())
+        self._next_publish = time.monotonic() + self.metrics_interval
+        try:
+            with get_db_context() as db:
+                db.execute("""
+                    INSERT INTO audit_sink_metrics (process, metrics, updated_at)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(process) DO UPDATE SET
+                        metrics = excluded.metrics,
+                        updated_at = excluded.updated_at
+                """, (self.process, json.dumps(self._raw_stats()), now))
+                db.execute(
+                    "DELETE FROM audit_sink_metrics WHERE updated_at < ?", (now - 3 * self.metrics_interval,)
+                )
+        except Exception as e:
+            print(f"[AUDIT ERROR] Publishing metrics failed: {e}")
+
+    def _unpublish(self):
+        try:
+            with get_db_context() as db:
+                db.execute("DELETE FROM audit_sink_metrics WHERE process = ?", (self.process,))
+        except Exception as e:
+            print(f"[AUDIT ERROR] Removing metrics failed: {e}")
+
+    def _run(self):
+        while True:
+            if time.monotonic() >= self._next_publish:
+                self._publish()
+            try:
+                first = self._queue.get(timeout=max(0, self._next_publish - time.monotonic()))
+            except queue.Empty:
+                continue
+            if first is _STOP:
+                self._queue.task_done()
+                return
+
+            # Collect until the batch is full or the flush interval has elapsed
+            batch = [first]
+            stop = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+
+            self._flush_batch(batch)
+            for _ in range(len(batch) + (1 if stop else 0)):
+                self._queue.task_done()
+            if stop:
+                return
+
+    def flush(self):
+        """Blocks until every event queued so far has been written."""
+        self._queue.join()
+
+    def close(self, timeout=5):
+        """Drains the queue and stops the worker (registered at exit)."""
+        if not self._worker.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._worker.join(timeout)
+        self._unpublish()
+
+    def metrics(self):
+        return _summarize(self._raw_stats())
+
+_sink = None
+_sink_pid = None
+_sink_lock = threading.Lock()
+
+def get_sink():
+    """Returns this process's audit sink, starting it on first use (and again after fork)."""
+    global _sink, _sink_pid
+    pid = os.getpid()
+    if _sink is None or _sink_pid != pid:
+        with _sink_lock:
+            if _sink is None or _sink_pid != pid:
+                _sink = AuditSink()
+                _sink_pid = pid
+                atexit.register(_sink.close)
+    return _sink
 
 class AuditLogger:
     """Logs system events for security monitoring."""
-    
+
     @staticmethod
     def log_event(username, action, status="success"):
         ip = request.remote_addr if request else "0.0.0.0"
-        with get_db_context() as db:
-            db.execute("""
-                INSERT INTO audit_logs (username, action, status, ip_address)
-                VALUES (?, ?, ?, ?)
-            """, (username, action, status, ip))
+        timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        row = (timestamp, username, action, status, ip)
+        if AUDIT_ASYNC:
+            get_sink().submit(row)
+        else:
+            _write_rows([row])
         print(f"[AUDIT] {username} performed {action}: {status}")
 
     @staticmethod
-    def get_all_logs(limit=100):
-        """Retrieves the latest system logs."""
+    def flush():
+        """Waits for queued audit events to reach the database."""
+        if AUDIT_ASYNC:
+            get_sink().flush()
+
+    @staticmethod
+    def metrics():
+        """Queue depth, throughput and flush latency of this process's background writer."""
+        return get_sink().metrics() if AUDIT_ASYNC else {}
+
+    @staticmethod
+    def cluster_metrics():
+        """
+        Writer metrics of every process that published within the last three
+        AUDIT_METRICS_INTERVALs: their sum ("total") and each process on its own.
+        """
+        with get_db_context() as db:
+            rows = db.execute(
+                "SELECT process, metrics FROM audit_sink_metrics WHERE updated_at >= ? ORDER BY process",
+                (int(time.time() - 3 * AUDIT_METRICS_INTERVAL),)
+            ).fetchall()
+        if not rows:
+            return {"total": {}, "processes": {}}
+
+        raw = {row["process"]: json.loads(row["metrics"]) for row in rows}
+        total = {}
+        for stats in raw.values():
+            for key, value in stats.items():
+                total[key] = max(total.get(key, 0), value) if key.startswith("max_") else total.get(key, 0) + value
+        # last_flush_ms has no meaningful sum
+        total.pop("last_flush_ms", None)
+        return {
+            "total": _summarize(total),
+            "processes": {process: _summarize(stats) for process, stats in raw.items()}
+        }
+
+    @staticmethod
+    def query_logs(limit=100, cursor=None, username=None, action_prefix=None,
+                   status=None, since=None, until=None):
+        """
+        Keyset-paginated log query, newest first. Pass the returned
+        `next_cursor` back as `cursor` to fetch the following page.
+
+        Each page is an index seek that yields rows in id order, never a sort.
+        `action_prefix` picks an action type ("upload" or "upload:"); anything
+        after the ":" must prefix the full action. `since`/`until` are UTC
+        "YYYY-MM-DD HH:MM:SS" bounds (until is exclusive), resolved to id
+        bounds, so events flushed out of order may land just outside them.
+        """
+        limit = max(1, min(int(limit), 500))
+        clauses = []
+        params = []
+
+        if cursor is not None:
+            clauses.append("id < ?")
+            params.append(int(cursor))
+        if username:
+            clauses.append("username = ?")
+            params.append(username)
+        if action_prefix:
+            clauses.append("action_type = ?")
+            params.append(action_type(action_prefix))
+            if action_prefix.partition(":")[2]:
+                sql, bounds = prefix_range("action", action_prefix)
+                clauses.append(sql)
+                params.extend(bounds)
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+
         with get_db_context() as db:
-            logs = db.execute("""
-                SELECT timestamp, username, action, status, ip_address 
-                FROM audit_logs 
-                ORDER BY timestamp DESC 
+            if since:
+                first_id = _first_id_at(db, since)
+                if first_id is None:
+                    return {"logs": [], "next_cursor": None}
+                clauses.append("id >= ?")
+                params.append(first_id)
+            if until:
+                end_id = _first_id_at(db, until)
+                if end_id is not None:
+                    clauses.append("id < ?")
+                    params.append(end_id)
+
+            where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+            rows = db.execute(f"""
+                SELECT id, timestamp, username, action, status, ip_address
+                FROM audit_logs
+                {where}
+                ORDER BY id DESC
                 LIMIT ?
-            """, (limit,)).fetchall()
-            return [dict(log) for log in logs]
+            """, params + [limit + 1]).fetchall()
+
+        logs = [_serialize_log(row) for row in rows[:limit]]
+        return {
+            "logs": logs,
+            "next_cursor": logs[-1]["id"] if len(rows) > limit else None
+        }
+
+    @staticmethod
+    def get_all_logs(limit=100):
+        """Retrieves the latest system logs."""
+        return AuditLogger.query_logs(limit=limit)["logs"]
@@ -0,0 +1,130 @@
+import uuid
+from cloud.backends import get_backend
+from .db import get_db_context
+
+# Usernames are [a-zA-Z0-9_], so these prefixes can never collide with "<user>/<filename>"
+CAS_PREFIX = ".cas"
+STAGING_PREFIX = ".staging"
+
+class BlobStore:
+    """
+    Content-addressed, reference-counted blob store (table blobs).
+
+    Encrypted uploads are staged under `.staging/`, then committed by
+    plaintext SHA-256: content that is already stored only gains a reference
+    and the staged copy is dropped. `file_metadata.storage_key` points each
+    user entry at its blob; NULL means a legacy object at "<owner>/<filename>".
+    Each blob generation gets its own key, so releasing an old generation can
+    never delete the object of a newer one.
+    """
+
+    @staticmethod
+    def staging_key():
+        return f"{STAGING_PREFIX}/{uuid.uuid4().hex}"
+
+    @staticmethod
+    def legacy_key(owner, filename):
+        return f"{owner}/{filename}"
+
+    @staticmethod
+    def lookup(file_hash):
+        """Returns the storage key of a live blob with this hash, or None."""
+        with get_db_context() as db:
+            row = db.execute(
+                "SELECT storage_key FROM blobs WHERE file_hash = ? AND refcount > 0", (file_hash,)
+            ).fetchone()
+        return row["storage_key"] if row else None
+
+    @staticmethod
+    def acquire(file_hash):
+        """Adds a reference to an existing blob; returns its key, or None if there is none."""
+        with get_db_context() as db:
+            cur = db.execute(
+                "UPDATE blobs SET refcount = refcount + 1 WHERE file_hash = ? AND refcount > 0", (file_hash,)
+            )
+            if cur.rowcount != 1:
+                return None
+            row = db.execute("SELECT storage_key FROM blobs WHERE file_hash = ?", (file_hash,)).fetchone()
+        return row["storage_key"]
+
+    @staticmethod
+    def commit(staged_key, file_hash, size):
+        """
+        Turns a staged object into a referenced blob and returns the blob's key.
+        The caller owns one reference and must hand it to a file_metadata row.
+        """
+        backend = get_backend()
+        existing = BlobStore.acquire(file_hash)
+        if existing:
+            backend.delete(staged_key)
+            print(f"[BLOBSTORE] Deduplicated {file_hash[:12]} ({size} bytes)")
+            return existing
+
+        blob_key = f"{CAS_PREFIX}/{file_hash}/{uuid.uuid4().hex[:12]}"
+        backend.move(staged_key, blob_key)
+        with get_db_context() as db:
+            db.execute("""
+                INSERT INTO blobs (file_hash, storage_key, size, refcount)
+                VALUES (?, ?, ?, 1)
+                ON CONFLICT(file_hash) DO UPDATE SET refcount = blobs.refcount + 1
+            """, (file_hash, blob_key, size))
+            row = db.execute("SELECT storage_key FROM blobs WHERE file_hash = ?", (file_hash,)).fetchone()
+
+        if row["storage_key"] != blob_key:
+            # A concurrent upload of the same content committed first
+            backend.delete(blob_key)
+        return row["storage_key"]
+
+    @staticmethod
+    def release(storage_key):
+        """
+        Drops one reference to a blob, deleting the object with its last reference.
+        Call after the transaction that removed the referencing row has committed.
+        """
+        if not storage_key:
+            return False
+        with get_db_context() as db:
+            db.execute("UPDATE blobs SET refcount = refcount - 1 WHERE storage_key = ?", (storage_key,))
+            cur = db.execute("DELETE FROM blobs WHERE storage_key = ? AND refcount <= 0", (storage_key,))
+            unreferenced = cur.rowcount == 1
+        if unreferenced:
+            get_backend().delete(storage_key)
+        return unreferenced
+
+    @staticmethod
+    def resolve(owner, filename):
+        """Returns the backend key holding a user's file (blob or legacy object)."""
+        with get_db_context() as db:
+            row = db.execute(
+                "SELECT storage_key FROM file_metadata WHERE owner = ? AND filename = ?", (owner, filename)
+            ).fetchone()
+        if row and row["storage_key"]:
+            return row["storage_key"]
+        return BlobStore.legacy_key(owner, filename)
+
+    @staticmethod
+    def remove_entries(db, owner, filename=None):
+        """
+        Deletes a user's file_metadata rows (one file or all) inside the caller's
+        transaction and returns their storage keys, to release() after it commits.
+        """
+        if filename is None:
+            rows = db.execute(
+                "SELECT storage_key FROM file_metadata WHERE owner = ?", (owner,)
+            ).fetchall()
+            db.execute("DELETE FROM file_metadata WHERE owner = ?", (owner,))
+        else:
+            rows = db.execute(
+                "SELECT storage_key FROM file_metadata WHERE owner = ? AND filename = ?", (owner, filename)
+            ).fetchall()
+            db.execute("DELETE FROM file_metadata WHERE owner = ? AND filename = ?", (owner, filename))
+        return [row["storage_key"] for row in rows]
+
+    @staticmethod
+    def delete_entries(owner, filename=None):
+        """Deletes a user's file_metadata rows (one file or all) and releases their blobs."""
+        with get_db_context() as db:
+            storage_keys = BlobStore.remove_entries(db, owner, filename)
+        for storage_key in storage_keys:
+            BlobStore.release(storage_key)
+        return len(storage_keys)
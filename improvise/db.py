@@ -1,23 +1,28 @@
-import sqlite3
-from contextlib import contextmanager
-from config import DB_NAME
+from database import get_db, add_column_if_missing, use_binary_collation
 
-@contextmanager
 def get_db_context():
-    """Context manager for safe database operations."""
-    conn = sqlite3.connect(DB_NAME, timeout=10)
-    conn.row_factory = sqlite3.Row
-    try:
-        yield conn
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+    """Context manager for safe database operations (pooled connection, one transaction)."""
+    return get_db()
+
+def db_time(value):
+    """DATETIME column value as SQLite's "YYYY-MM-DD HH:MM:SS" text (PostgreSQL returns datetime objects)."""
+    if hasattr(value, "strftime"):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    return value
+
+def prefix_range(column, prefix):
+    """
+    Case-sensitive "column starts with prefix" as an index-seekable range:
+    returns (sql, params). LIKE cannot seek on SQLite (it ignores case).
+    The column must compare bytewise: on PostgreSQL, give it use_binary_collation().
+    """
+    last = ord(prefix[-1])
+    if last >= 0x10FFFF:
+        return f"{column} >= ?", [prefix]
+    return f"{column} >= ? AND {column} < ?", [prefix, prefix[:-1] + chr(last + 1)]
 
 def init_enhanced_tables():
-    """Initializes tables for audit logs and file metadata."""
+    """Initializes tables for audit logs, file metadata, blobs and background jobs."""
     with get_db_context() as db:
         # Audit Logs
         db.execute("""
@@ -31,6 +36,36 @@ def init_enhanced_tables():
             )
         """)
         
+        # Action type: the part of the action before ":" ("upload:<file>" -> "upload")
+        add_column_if_missing(db, "audit_logs", "action_type", "TEXT")
+        # Filtered with prefix_range()
+        use_binary_collation(db, "audit_logs", "action")
+        
+        # Keyset pagination walks id DESC; each equality filter gets an (column, id) index
+        db.execute("CREATE INDEX IF NOT EXISTS idx_audit_logs_username ON audit_logs (username, id)")
+        db.execute("DROP INDEX IF EXISTS idx_audit_logs_action")
+        db.execute("CREATE INDEX IF NOT EXISTS idx_audit_logs_action_type ON audit_logs (action_type, id)")
+        db.execute("CREATE INDEX IF NOT EXISTS idx_audit_logs_status ON audit_logs (status, id)")
+        # Resolves time bounds to id bounds
+        db.execute("CREATE INDEX IF NOT EXISTS idx_audit_logs_timestamp ON audit_logs (timestamp, id)")
+        
+        # Migration: fill action_type for rows logged before it existed (a seek on the index above)
+        untyped = db.execute("SELECT id, action FROM audit_logs WHERE action_type IS NULL").fetchall()
+        if untyped:
+            db.executemany(
+                "UPDATE audit_logs SET action_type = ? WHERE id = ?",
+                [((row["action"] or "").partition(":")[0], row["id"]) for row in untyped]
+            )
+        
+        # Audit writer metrics of every process, aggregated by the admin app (times are epoch seconds)
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS audit_sink_metrics (
+                process TEXT PRIMARY KEY,
+                metrics TEXT,
+                updated_at INTEGER
+            )
+        """)
+        
         # File Metadata (for AI Analysis)
         db.execute("""
             CREATE TABLE IF NOT EXISTS file_metadata (
@@ -49,7 +84,52 @@ def init_enhanced_tables():
         """)
         
         # Ensure is_active exists if table was already created
-        try:
-            db.execute("ALTER TABLE file_metadata ADD COLUMN is_active INTEGER DEFAULT 1")
-        except sqlite3.OperationalError:
-            pass # Already exists
+        add_column_if_missing(db, "file_metadata", "is_active", "INTEGER DEFAULT 1")
+        # Blob holding the file (NULL = legacy object at "<owner>/<filename>")
+        add_column_if_missing(db, "file_metadata", "storage_key", "TEXT")
+        # Filtered with prefix_range(); name order then matches SQLite too
+        use_binary_collation(db, "file_metadata", "filename")
+        
+        # File listing walks (owner, <sort column>, id); name order uses UNIQUE(owner, filename)
+        db.execute("CREATE INDEX IF NOT EXISTS idx_file_metadata_owner_time ON file_metadata (owner, upload_time, id)")
+        db.execute("CREATE INDEX IF NOT EXISTS idx_file_metadata_owner_size ON file_metadata (owner, size, id)")
+        # Known-bad content lookups by hash
+        db.execute("CREATE INDEX IF NOT EXISTS idx_file_metadata_hash ON file_metadata (file_hash)")
+        
+        # Content-Addressed Blobs (shared by every entry with the same content)
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                file_hash TEXT PRIMARY KEY,
+                storage_key TEXT UNIQUE NOT NULL,
+                size INTEGER,
+                refcount INTEGER DEFAULT 0,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # Self-Healing Quarantine Queue (times are epoch seconds)
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS quarantine_queue (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                owner TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                risk_score INTEGER,
+                status TEXT DEFAULT 'pending',
+                attempts INTEGER DEFAULT 0,
+                next_attempt_at INTEGER DEFAULT 0,
+                locked_until INTEGER DEFAULT 0,
+                last_error TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(owner, filename)
+            )
+        """)
+        db.execute("CREATE INDEX IF NOT EXISTS idx_quarantine_queue_due ON quarantine_queue (status, next_attempt_at)")
+        
+        # Leases for background jobs that must run on a single node
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS job_leases (
+                name TEXT PRIMARY KEY,
+                holder TEXT,
+                expires_at INTEGER
+            )
+        """)
@@ -0,0 +1,112 @@
+import json
+import base64
+from .db import get_db_context, prefix_range, db_time
+
+class FileIndex:
+    """
+    Per-user file listing served from file_metadata instead of the storage
+    backend. Pages are keyset-paginated over (owner, <sort column>, id)
+    indexes, so a request costs O(page) however many files a user has.
+    """
+
+    SORTS = {
+        "name": "filename",
+        "time": "upload_time",
+        "size": "size",
+    }
+
+    @staticmethod
+    def _encode_cursor(values):
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+    @staticmethod
+    def _decode_cursor(cursor):
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        except Exception:
+            raise ValueError("invalid cursor")
+        if not isinstance(values, list) or len(values) != 2:
+            raise ValueError("invalid cursor")
+        return values
+
+    @staticmethod
+    def _serialize(row):
+        entry = dict(row)
+        entry.pop("id", None)
+        entry["upload_time"] = db_time(entry["upload_time"])
+        return entry
+
+    @staticmethod
+    def list_files(owner, limit=100, cursor=None, sort="name", order="asc", prefix=None):
+        """
+        Lists a user's active (non-quarantined) files.
+        Pass the returned `next_cursor` back as `cursor` for the following page.
+        `sort` is name | time | size, `order` asc | desc, `prefix` filters by filename (case-sensitive).
+        """
+        if sort not in FileIndex.SORTS:
+            raise ValueError(f"invalid sort: {sort}")
+        if order not in ("asc", "desc"):
+            raise ValueError(f"invalid order: {order}")
+
+        column = FileIndex.SORTS[sort]
+        direction = "DESC" if order == "desc" else "ASC"
+        compare = "<" if order == "desc" else ">"
+        limit = max(1, min(int(limit), 500))
+        clauses = ["owner = ?", "is_active = 1"]
+        params = [owner]
+
+        if prefix:
+            # Case-sensitive on every backend and sort; name sorts seek (owner, filename) with it
+            sql, bounds = prefix_range("filename", prefix)
+            clauses.append(sql)
+            params.extend(bounds)
+        if cursor:
+            value, last_id = FileIndex._decode_cursor(cursor)
+            clauses.append(f"({column}, id) {compare} (?, ?)")
+            params.extend([value, int(last_id)])
+
+        with get_db_context() as db:
+            rows = db.execute(f"""
+                SELECT id, filename, size, mime_type, risk_score, upload_time
+                FROM file_metadata
+                WHERE {' AND '.join(clauses)}
+                ORDER BY {column} {direction}, id {direction}
+                LIMIT ?
+            """, params + [limit + 1]).fetchall()
+
+        page = rows[:limit]
+        next_cursor = None
+        if len(rows) > limit:
+            last = page[-1]
+            value = last[column]
+            if hasattr(value, "isoformat"):
+                # Full precision: PostgreSQL timestamps carry microseconds
+                value = value.isoformat(sep=" ")
+            next_cursor = FileIndex._encode_cursor([value, last["id"]])
+
+        return {
+            "files": [FileIndex._serialize(row) for row in page],
+            "next_cursor": next_cursor
+        }
+
+    @staticmethod
+    def index_storage(owner, names, size_of):
+        """
+        Adds file_metadata rows for objects found in storage that have none
+        (uploads older than the metadata table). `size_of(name)` returns the
+        plaintext size, or None to skip the object. Returns the number added.
+        """
+        added = 0
+        with get_db_context() as db:
+            for name in names:
+                size = size_of(name)
+                if size is None:
+                    continue
+                cur = db.execute("""
+                    INSERT INTO file_metadata (filename, owner, size, is_active)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(owner, filename) DO NOTHING
+                """, (name, owner, size, 0 if name.endswith(".quarantine") else 1))
+                added += cur.rowcount
+        return added
@@ -0,0 +1,46 @@
+import os
+import mmap
+import hashlib
+from config import HASH_CACHE_SIZE, HASH_BUFFER_SIZE
+from engine.cache import LRUCache
+
+# (path, size, mtime_ns, inode) -> hex digest: any change to the file changes the key
+_digests = LRUCache(maxsize=HASH_CACHE_SIZE)
+
+def _digest(f, size, algorithm):
+    if hasattr(hashlib, "file_digest"): # Python 3.11+: hashes in C with a large buffer
+        return hashlib.file_digest(f, algorithm).hexdigest()
+
+    hasher = hashlib.new(algorithm)
+    if size > 0:
+        # One update over the mapped file (the GIL is released while hashing)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            hasher.update(mapped)
+        return hasher.hexdigest()
+
+    buffer = bytearray(HASH_BUFFER_SIZE)
+    view = memoryview(buffer)
+    while True:
+        n = f.readinto(buffer)
+        if not n:
+            break
+        hasher.update(view[:n])
+    return hasher.hexdigest()
+
+def file_digest(path, algorithm="sha256"):
+    """Hex digest of a file, served from the LRU cache while the file is unchanged."""
+    st = os.stat(path)
+    key = (os.path.realpath(path), st.st_size, st.st_mtime_ns, st.st_ino, algorithm)
+    digest = _digests.get(key)
+    if digest is None:
+        with open(path, "rb") as f:
+            digest = _digest(f, st.st_size, algorithm)
+        _digests.set(key, digest)
+    return digest
+
+def cache_stats():
+    return _digests.stats()
+
+def is_sha256_hex(value):
+    """True for a 64-character hex SHA-256 digest (e.g. a client-declared X-Content-SHA256)."""
+    return isinstance(value, str) and len(value) == 64 and all(c in "0123456789abcdefABCDEF" for c in value)
@@ -0,0 +1,190 @@
+"""
+Background mail dispatch.
+
+Requests queue messages and return at once; worker threads deliver them
+over SMTP connections they keep open between messages (closed after
+MAIL_IDLE_TIMEOUT seconds without mail). Transient failures are retried
+with exponential backoff, and the final delivery status of every message
+is written to the audit log.
+
+To try it without a real mail server, run a local SMTP stand-in such as
+`python -m aiosmtpd -n -l localhost:1025` and set
+MAIL_SERVER=localhost MAIL_PORT=1025 MAIL_USE_TLS=False.
+"""
+import os
+import time
+import queue
+import atexit
+import smtplib
+import threading
+from flask_mail import BadHeaderError
+from config import (
+    MAIL_ASYNC, MAIL_QUEUE_SIZE, MAIL_WORKERS, MAIL_MAX_ATTEMPTS, MAIL_RETRY_DELAY, MAIL_IDLE_TIMEOUT
+)
+from .audit import AuditLogger
+
+_STOP = object()
+
+def is_permanent(error):
+    """True if sending the same message again cannot help (a 5xx reply or a malformed message)."""
+    if isinstance(error, (BadHeaderError, AssertionError)):
+        return True
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        # 4xx for any recipient (mailbox busy, greylisting) is worth another try
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, (smtplib.SMTPSenderRefused, smtplib.SMTPDataError)):
+        return error.smtp_code >= 500
+    return False
+
+class MailDispatcher:
+    """Bounded mail queue served by `workers` threads, each with its own SMTP connection."""
+
+    def __init__(self, app, mail, workers=MAIL_WORKERS, max_queue=MAIL_QUEUE_SIZE,
+                 max_attempts=MAIL_MAX_ATTEMPTS, retry_delay=MAIL_RETRY_DELAY, idle_timeout=MAIL_IDLE_TIMEOUT):
+        self.app = app
+        self.mail = mail
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.idle_timeout = idle_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stats_lock = threading.Lock()
+        self._stats = {"queued": 0, "rejected": 0, "delivered": 0, "retried": 0, "failed": 0, "connections": 0}
+        self._workers = [
+            threading.Thread(target=self._run, name=f"mail-dispatcher-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def _bump(self, **deltas):
+        with self._stats_lock:
+            for key, value in deltas.items():
+                self._stats[key] += value
+
+    def submit(self, msg, username, action):
+        """Queues a flask_mail Message. Returns False if the queue is full."""
+        try:
+            self._queue.put_nowait((msg, username, action))
+        except queue.Full:
+            self._bump(rejected=1)
+            return False
+        self._bump(queued=1)
+        return True
+
+    def _open(self):
+        conn = self.mail.connect()
+        conn.__enter__()
+        self._bump(connections=1)
+        return conn
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.__exit__(None, None, None)
+        except Exception:
+            pass
+
+    def _deliver(self, conn, msg, username, action):
+        """Sends one message with retries; returns the connection to keep using (or None)."""
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                if conn is None:
+                    conn = self._open()
+                conn.send(msg)
+                self._bump(delivered=1)
+                AuditLogger.log_event(username, f"{action}:delivery", "delivered")
+                return conn
+            except Exception as e:
+                error = e
+                if is_permanent(e):
+                    break
+                # The connection may be half-dead: start the next attempt on a fresh one
+                if conn is not None:
+                    self._close(conn)
+                    conn = None
+                if attempt < self.max_attempts:
+                    self._bump(retried=1)
+                    delay = self.retry_delay * 2 ** (attempt - 1)
+                    print(f"[MAIL ERROR] {action} for {username} failed (attempt {attempt}): {e}. Retrying in {delay:.1f}s")
+                    time.sleep(delay)
+
+        self._bump(failed=1)
+        print(f"[MAIL ERROR] Giving up on {action} for {username}: {error}")
+        AuditLogger.log_event(username, f"{action}:delivery", f"failed:{type(error).__name__}")
+        return conn
+
+    def _run(self):
+        conn = None
+        with self.app.app_context():
+            while True:
+                try:
+                    item = self._queue.get(timeout=self.idle_timeout if conn else None)
+                except queue.Empty:
+                    # Idle: don't hold a session the server will time out anyway
+                    self._close(conn)
+                    conn = None
+                    continue
+                if item is _STOP:
+                    self._queue.task_done()
+                    break
+                try:
+                    conn = self._deliver(conn, *item)
+                finally:
+                    self._queue.task_done()
+        if conn is not None:
+            self._close(conn)
+
+    def flush(self):
+        """Blocks until every message queued so far has been delivered or given up on."""
+        self._queue.join()
+
+    def close(self, timeout=5):
+        """Delivers what is queued and stops the workers (registered at exit)."""
+        deadline = time.monotonic() + timeout
+        alive = [worker for worker in self._workers if worker.is_alive()]
+        for _ in alive:
+            try:
+                self._queue.put(_STOP, timeout=max(0, deadline - time.monotonic()))
+            except queue.Full:
+                # Still backed up: the daemon workers die with the process
+                print(f"[MAIL ERROR] Exiting with {self._queue.qsize()} messages undelivered")
+                break
+        for worker in alive:
+            worker.join(max(0, deadline - time.monotonic()))
+
+    def metrics(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["queue_capacity"] = self._queue.maxsize
+        return stats
+
+_dispatcher = None
+_dispatcher_pid = None
+_dispatcher_lock = threading.Lock()
+
+def get_dispatcher(app, mail):
+    """Returns this process's dispatcher, starting it on first use (and again after fork)."""
+    global _dispatcher, _dispatcher_pid
+    pid = os.getpid()
+    if _dispatcher is None or _dispatcher_pid != pid:
+        with _dispatcher_lock:
+            if _dispatcher is None or _dispatcher_pid != pid:
+                _dispatcher = MailDispatcher(app, mail)
+                _dispatcher_pid = pid
+                atexit.register(_dispatcher.close)
+    return _dispatcher
+
+def send_mail(app, mail, msg, username, action):
+    """
+    Queues `msg` for background delivery (or sends it inline when MAIL_ASYNC
+    is off). Returns False if it could not be queued or sent.
+    """
+    if MAIL_ASYNC:
+        return get_dispatcher(app, mail).submit(msg, username, action)
+    try:
+        mail.send(msg)
+    except Exception as e:
+        print(f"Mail Error: {e}")
+        return False
+    return True
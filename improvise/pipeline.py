@@ -0,0 +1,197 @@
+import hashlib
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import MultipartDecoder, NeedData, File, Data, Epilogue
+from config import MAX_CONTENT_LENGTH, VAULT_CHUNK_SIZE
+from cloud.backends import get_backend
+from .vault import Vault, HEADER_LEN
+from .blobstore import BlobStore
+from .sniffer import SNIFF_BYTES, sniff
+
+class UploadTooLarge(Exception):
+    """Raised mid-stream once an upload exceeds the configured size limit."""
+
+class ContentHashMismatch(Exception):
+    """Raised when the uploaded bytes do not match the client-declared SHA-256."""
+
+class KnownBadContent(Exception):
+    """Raised when an upload's hash is rejected by the pipeline's `reject_hash` check."""
+
+class MultipartFileReader:
+    """
+    Incremental multipart/form-data reader over the raw request stream.
+    File contents are yielded as they arrive instead of being spooled to disk.
+    """
+
+    def __init__(self, stream, content_type, read_size=None):
+        mimetype, options = parse_options_header(content_type or "")
+        boundary = options.get("boundary")
+        if mimetype != "multipart/form-data" or not boundary:
+            raise ValueError("expected multipart/form-data with a boundary")
+
+        self.stream = stream
+        self.read_size = read_size or VAULT_CHUNK_SIZE
+        self._decoder = MultipartDecoder(boundary.encode("latin-1"))
+        self._events = self._iter_events()
+
+    def _iter_events(self):
+        eof = False
+        while True:
+            event = self._decoder.next_event()
+            if isinstance(event, NeedData):
+                if eof:
+                    raise ValueError("unexpected end of multipart body")
+                data = self.stream.read(self.read_size)
+                eof = not data
+                self._decoder.receive_data(data or None)
+                continue
+            yield event
+            if isinstance(event, Epilogue):
+                return
+
+    def find_file(self, field_name):
+        """Advances to the file part named `field_name` and returns its client filename."""
+        for event in self._events:
+            if isinstance(event, File) and event.name == field_name:
+                return event.filename
+        return None
+
+    def iter_data(self):
+        """Yields the body of the current part in the order it is received."""
+        for event in self._events:
+            if not isinstance(event, Data):
+                break
+            if event.data:
+                yield event.data
+            if not event.more_data:
+                break
+
+class UploadPipeline:
+    """
+    Single-pass upload stage: hashes, size-checks, sniffs and encrypts the
+    incoming chunks while they are pushed to a staging object, so the file is
+    read exactly once (only the first SNIFF_BYTES are kept for sniffing). The staged object is then committed to the BlobStore, where
+    content that is already stored is deduplicated.
+
+    With a client-declared SHA-256 (`declared_hash`), known-bad content is
+    rejected before any byte is read, and content that is already stored is
+    only hashed to prove possession: no encryption and no storage I/O.
+    """
+
+    def __init__(self, user, filename, max_size=None, declared_hash=None, reject_hash=None):
+        self.user = user
+        self.filename = filename
+        self.max_size = max_size or MAX_CONTENT_LENGTH
+        self.declared_hash = declared_hash.lower() if declared_hash else None
+        self.reject_hash = reject_hash
+        self.deduplicated = False
+        self.size = 0
+        self._hasher = hashlib.sha256()
+        self._head = bytearray()
+
+    @property
+    def file_hash(self):
+        return self._hasher.hexdigest()
+
+    @property
+    def mime_type(self):
+        """Content type sniffed from the first SNIFF_BYTES of the stream."""
+        return sniff(bytes(self._head))
+
+    def _tap(self, chunks):
+        for chunk in chunks:
+            self.size += len(chunk)
+            if self.size > self.max_size:
+                raise UploadTooLarge(f"upload exceeds {self.max_size} bytes")
+            self._hasher.update(chunk)
+            if len(self._head) < SNIFF_BYTES:
+                self._head += chunk[:SNIFF_BYTES - len(self._head)]
+            yield chunk
+
+    def _check_hash(self, file_hash):
+        if self.reject_hash and self.reject_hash(file_hash):
+            raise KnownBadContent(file_hash)
+
+    def _verify(self):
+        if self.declared_hash and self.file_hash != self.declared_hash:
+            raise ContentHashMismatch(f"declared {self.declared_hash}, received {self.file_hash}")
+
+    def _result(self, storage_key):
+        return {
+            "size": self.size,
+            "file_hash": self.file_hash,
+            "mime_type": self.mime_type,
+            "storage_key": storage_key
+        }
+
+    def run(self, chunks):
+        """
+        Streams `chunks` through the pipeline and returns the analysis inputs.
+        The returned `storage_key` carries one blob reference for the file's metadata row.
+        """
+        if self.declared_hash:
+            self._check_hash(self.declared_hash)
+            # Hold a reference while the body is verified so the blob cannot be released
+            storage_key = BlobStore.acquire(self.declared_hash)
+            if storage_key:
+                try:
+                    for _ in self._tap(chunks):
+                        pass
+                    self._verify()
+                except BaseException:
+                    BlobStore.release(storage_key)
+                    raise
+                self.deduplicated = True
+                print(f"[BLOBSTORE] Deduplicated {self.filename} for {self.user} without re-encrypting")
+                return self._result(storage_key)
+
+        staged_key = BlobStore.staging_key()
+        backend = get_backend()
+        backend.save_stream(staged_key, Vault.encrypt_stream(self._tap(chunks)))
+        try:
+            self._verify()
+            self._check_hash(self.file_hash)
+        except BaseException:
+            backend.delete(staged_key)
+            raise
+        print(f"[{backend.name.upper()}] Streamed {self.filename} for {self.user}")
+        return self._result(BlobStore.commit(staged_key, self.file_hash, self.size))
+
+class DownloadStream:
+    """
+    Random-access plaintext view of a stored object. Chunked containers are
+    fetched and decrypted segment by segment, only over the requested range.
+    """
+
+    def __init__(self, key, info):
+        self.key = key
+        self.etag = info["etag"]
+        self._backend = get_backend()
+        self._encrypted_size = info["size"]
+        self._legacy_data = None
+
+        self._header = b"".join(self._backend.iter_range(key, 0, HEADER_LEN))
+        if Vault.is_chunked(self._header):
+            self.size = Vault.plaintext_size(self._header, self._encrypted_size)
+        else:
+            # Legacy Fernet blob: not seekable, decrypt once in memory
+            self._legacy_data = Vault.decrypt_data(self._backend.get(key))
+            self.size = len(self._legacy_data)
+
+    @classmethod
+    def open(cls, user, filename):
+        """Returns a DownloadStream over the user's file, or None if it does not exist."""
+        key = BlobStore.resolve(user, filename)
+        info = get_backend().stat(key)
+        if info is None:
+            return None
+        return cls(key, info)
+
+    def _read_range(self, offset, length):
+        return self._backend.iter_range(self.key, offset, length)
+
+    def iter_range(self, start, stop):
+        """Yields plaintext bytes [start, stop)."""
+        if self._legacy_data is not None:
+            yield self._legacy_data[start:stop]
+            return
+        yield from Vault.decrypt_range(self._header, self._encrypted_size, self._read_range, start, stop)
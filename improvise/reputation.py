@@ -0,0 +1,192 @@
+"""
+Known-bad SHA-256 reputation index.
+
+One file holds a bloom filter followed by the sorted raw digests:
+
+    header  MAGIC | count (Q) | bloom bits (Q) | hash count (I)
+    bloom   ceil(bits / 8) bytes
+    digests count * 32 bytes, sorted
+
+The file is memory-mapped: the bloom filter answers most lookups for clean
+files in a few bit tests, and the rest are settled by binary search over the
+digests, so nothing is loaded into the Python heap. The index is reloaded when
+the file changes on disk (replace it atomically, as `build` does).
+
+    python -m improvise.reputation build hashes.txt [-o known_bad.idx]
+    python -m improvise.reputation check <sha256> [...]
+"""
+import os
+import sys
+import math
+import mmap
+import time
+import struct
+import bisect
+import argparse
+import threading
+from config import REPUTATION_INDEX, REPUTATION_RELOAD_INTERVAL
+
+MAGIC = b"CXREP1\x00\x00"
+HEADER = struct.Struct(">8sQQI")
+DIGEST_LEN = 32
+
+def _bloom_positions(digest, bits, hashes):
+    # Digests are already uniform: derive the k positions by double hashing their bytes
+    h1 = int.from_bytes(digest[:8], "big")
+    h2 = int.from_bytes(digest[8:16], "big") | 1
+    return [(h1 + i * h2) % bits for i in range(hashes)]
+
+class _Digests:
+    """Sequence view over the sorted digest array, for bisect."""
+
+    def __init__(self, buf, offset, count):
+        self.buf = buf
+        self.offset = offset
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        start = self.offset + i * DIGEST_LEN
+        return self.buf[start:start + DIGEST_LEN]
+
+class ReputationIndex:
+    """Read-only view over one index file."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            self.signature = (st.st_size, st.st_mtime_ns, st.st_ino)
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if st.st_size else b""
+
+        magic, self.count, self.bits, self.hashes = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a reputation index")
+        self._bloom_offset = HEADER.size
+        digests_offset = self._bloom_offset + (self.bits + 7) // 8
+        if len(self._map) != digests_offset + self.count * DIGEST_LEN:
+            raise ValueError(f"{path} is truncated")
+        self._digests = _Digests(self._map, digests_offset, self.count)
+
+    def _maybe_contains(self, digest):
+        bloom = self._map
+        base = self._bloom_offset
+        for pos in _bloom_positions(digest, self.bits, self.hashes):
+            if not bloom[base + (pos >> 3)] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def contains(self, file_hash):
+        """True if the hex SHA-256 is in the index."""
+        try:
+            digest = bytes.fromhex(file_hash)
+        except (TypeError, ValueError):
+            return False
+        if len(digest) != DIGEST_LEN or not self.count or not self._maybe_contains(digest):
+            return False
+        i = bisect.bisect_left(self._digests, digest)
+        return i < self.count and self._digests[i] == digest
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+
+def build(hex_lines, output, false_positive_rate=0.01):
+    """
+    Writes an index from an iterable of hex SHA-256 lines (blank lines and
+    "#" comments are skipped). The file is swapped in atomically. Returns the entry count.
+    """
+    digests = set()
+    for line in hex_lines:
+        line = line.strip().split()[0] if line.strip() else ""
+        if not line or line.startswith("#"):
+            continue
+        digest = bytes.fromhex(line)
+        if len(digest) != DIGEST_LEN:
+            raise ValueError(f"not a SHA-256 digest: {line}")
+        digests.add(digest)
+    digests = sorted(digests)
+
+    count = len(digests)
+    bits = max(8, int(math.ceil(-count * math.log(false_positive_rate) / math.log(2) ** 2)))
+    hashes = max(1, int(round(bits / max(count, 1) * math.log(2))))
+    bloom = bytearray((bits + 7) // 8)
+    for digest in digests:
+        for pos in _bloom_positions(digest, bits, hashes):
+            bloom[pos >> 3] |= 1 << (pos & 7)
+
+    tmp_path = f"{output}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, count, bits, hashes))
+        f.write(bloom)
+        for digest in digests:
+            f.write(digest)
+    os.replace(tmp_path, output)
+    return count
+
+_index = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+def get_index(path=None):
+    """
+    Returns the current index (None if the file does not exist), reopening
+    it at most every REPUTATION_RELOAD_INTERVAL seconds when the file changed.
+    """
+    global _index, _checked_at
+    path = path or REPUTATION_INDEX
+    now = time.monotonic()
+    if now - _checked_at < REPUTATION_RELOAD_INTERVAL and (_index is None or _index.path == path):
+        return _index
+
+    with _lock:
+        _checked_at = now
+        try:
+            st = os.stat(path)
+        except OSError:
+            _index = None
+            return None
+        if _index is None or _index.path != path or _index.signature != (st.st_size, st.st_mtime_ns, st.st_ino):
+            try:
+                _index = ReputationIndex(path)
+                print(f"[REPUTATION] Loaded {_index.count} known-bad hashes from {path}")
+            except (OSError, ValueError, struct.error) as e:
+                print(f"[REPUTATION ERROR] {e}")
+        return _index
+
+def is_known_bad(file_hash):
+    """True if the hash is in the known-bad reputation index."""
+    index = get_index()
+    return index is not None and index.contains(file_hash)
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="python -m improvise.reputation")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_cmd = sub.add_parser("build", help="build an index from a file of hex SHA-256 lines")
+    build_cmd.add_argument("source", help="input file, or - for stdin")
+    build_cmd.add_argument("-o", "--output", default=REPUTATION_INDEX)
+    build_cmd.add_argument("--fp-rate", type=float, default=0.01, help="bloom filter false-positive rate")
+    check_cmd = sub.add_parser("check", help="look up hashes in an index")
+    check_cmd.add_argument("hashes", nargs="+")
+    check_cmd.add_argument("-i", "--index", default=REPUTATION_INDEX)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        started = time.perf_counter()
+        if args.source == "-":
+            count = build(sys.stdin, args.output, args.fp_rate)
+        else:
+            with open(args.source) as f:
+                count = build(f, args.output, args.fp_rate)
+        print(f"[REPUTATION] Wrote {count} hashes to {args.output} in {time.perf_counter() - started:.1f}s")
+        return 0
+
+    index = ReputationIndex(args.index)
+    for file_hash in args.hashes:
+        print(f"{file_hash} {'KNOWN-BAD' if index.contains(file_hash) else 'clean'}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
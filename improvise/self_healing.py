@@ -1,62 +1,248 @@
 import os
 import time
+import uuid
+import socket
 import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    QUARANTINE_CONCURRENCY, QUARANTINE_POLL_INTERVAL, QUARANTINE_MAX_ATTEMPTS, QUARANTINE_LEASE_TTL
+)
 from .db import get_db_context
 from .audit import AuditLogger
+from .blobstore import BlobStore
 from cloud.skystore import SkyStore
 
-def monitor_and_heal():
+QUARANTINE_THRESHOLD = 80
+# Quarantined files are renamed "<filename>.quarantine"
+QUARANTINE_SUFFIX = ".quarantine"
+LEASE_NAME = "self_healing"
+
+# Wakes this process's worker as soon as a job is enqueued locally
+_wake = threading.Event()
+
+class QuarantineQueue:
     """
-    Background function that periodically checks for files with risk_score > 80.
-    Quarantines high-risk files and updates the database.
+    Durable work queue of files waiting to be quarantined (table quarantine_queue).
+    One row per (owner, filename): enqueueing is idempotent.
     """
-    while True:
-        try:
-            with get_db_context() as db:
-                # Find high-risk active files
-                files_to_heal = db.execute("""
-                    SELECT filename, owner, risk_score 
-                    FROM file_metadata 
-                    WHERE risk_score > 80 AND is_active = 1
-                """).fetchall()
-
-                for file_info in files_to_heal:
-                    filename = file_info['filename']
-                    owner = file_info['owner']
-                    new_filename = f"{filename}.quarantine"
-                    
-                    # 1. Move/Rename in SkyStore
-                    encrypted_data = SkyStore.get_file_data(owner, filename)
-                    if encrypted_data:
-                        # Save under new name
-                        SkyStore.save_file(owner, new_filename, encrypted_data)
-                        
-                        # Delete original high-risk file
-                        SkyStore.delete_file(owner, filename)
-                        
-                        # 2. Update database
-                        db.execute("""
-                            UPDATE file_metadata 
-                            SET is_active = 0, filename = ? 
-                            WHERE filename = ? AND owner = ?
-                        """, (new_filename, filename, owner))
-                        
-                        # 3. Log the action
-                        AuditLogger.log_event(
-                            owner, 
-                            f"Critical Self-Healing Action: Quarantined {filename} (Risk: {file_info['risk_score']})",
-                            "healed"
-                        )
-                        print(f"[SELF-HEALING] Quarantined {filename} for user {owner}")
 
+    @staticmethod
+    def enqueue(owner, filename, risk_score, db=None):
+        """Queues a high-risk file. Pass `db` to enqueue inside the caller's transaction."""
+        now = int(time.time())
+        sql = """
+            INSERT INTO quarantine_queue (owner, filename, risk_score, status, attempts, next_attempt_at)
+            VALUES (?, ?, ?, 'pending', 0, ?)
+            ON CONFLICT(owner, filename) DO UPDATE SET
+                risk_score = excluded.risk_score,
+                status = 'pending',
+                attempts = 0,
+                next_attempt_at = excluded.next_attempt_at,
+                last_error = NULL
+            WHERE quarantine_queue.status IN ('done', 'failed')
+        """
+        if db is not None:
+            db.execute(sql, (owner, filename, risk_score, now))
+        else:
+            with get_db_context() as conn:
+                conn.execute(sql, (owner, filename, risk_score, now))
+        _wake.set()
+
+    @staticmethod
+    def backfill():
+        """Queues active high-risk files recorded before the queue existed."""
+        with get_db_context() as db:
+            db.execute("""
+                INSERT INTO quarantine_queue (owner, filename, risk_score, status, attempts, next_attempt_at)
+                SELECT owner, filename, risk_score, 'pending', 0, 0
+                FROM file_metadata
+                WHERE risk_score > ? AND is_active = 1
+                ON CONFLICT(owner, filename) DO NOTHING
+            """, (QUARANTINE_THRESHOLD,))
+
+    @staticmethod
+    def claim(limit, lock_seconds):
+        """Marks up to `limit` due jobs as running (stale running jobs are reclaimed)."""
+        now = int(time.time())
+        claimed = []
+        with get_db_context() as db:
+            rows = db.execute("""
+                SELECT id, owner, filename, risk_score, attempts
+                FROM quarantine_queue
+                WHERE (status = 'pending' AND next_attempt_at <= ?)
+                   OR (status = 'running' AND locked_until < ?)
+                ORDER BY next_attempt_at
+                LIMIT ?
+            """, (now, now, limit)).fetchall()
+            for row in rows:
+                cur = db.execute("""
+                    UPDATE quarantine_queue
+                    SET status = 'running', attempts = attempts + 1, locked_until = ?
+                    WHERE id = ? AND attempts = ?
+                """, (now + lock_seconds, row["id"], row["attempts"]))
+                if cur.rowcount == 1:
+                    claimed.append(dict(row))
+        return claimed
+
+    @staticmethod
+    def complete(job_id):
+        with get_db_context() as db:
+            db.execute("UPDATE quarantine_queue SET status = 'done', last_error = NULL WHERE id = ?", (job_id,))
+
+    @staticmethod
+    def fail(job, error):
+        """Schedules a retry with exponential backoff, or gives up after the max attempts."""
+        attempts = job["attempts"] + 1
+        if attempts >= QUARANTINE_MAX_ATTEMPTS:
+            status, next_attempt = "failed", 0
+        else:
+            status, next_attempt = "pending", int(time.time()) + 5 * 2 ** attempts
+        with get_db_context() as db:
+            db.execute("""
+                UPDATE quarantine_queue
+                SET status = ?, next_attempt_at = ?, last_error = ?
+                WHERE id = ?
+            """, (status, next_attempt, str(error)[:500], job["id"]))
+
+def quarantine_file(owner, filename, risk_score):
+    """
+    Moves one file to `<filename>.quarantine` and deactivates its metadata.
+    Returns False without touching it if the file no longer qualifies (re-uploaded
+    clean or re-scored since it was queued). Safe to re-run: a file already moved
+    by an interrupted attempt is not moved again.
+    """
+    new_filename = filename + QUARANTINE_SUFFIX
+
+    # 1. Update database: the row is re-checked and renamed in one transaction
+    # (replacing any metadata of an earlier quarantined copy)
+    replaced = []
+    with get_db_context() as db:
+        cur = db.execute("""
+            UPDATE file_metadata SET is_active = 0
+            WHERE filename = ? AND owner = ? AND is_active = 1 AND risk_score > ?
+        """, (filename, owner, QUARANTINE_THRESHOLD))
+        if cur.rowcount == 1:
+            replaced = BlobStore.remove_entries(db, owner, new_filename)
+            db.execute(
+                "UPDATE file_metadata SET filename = ? WHERE filename = ? AND owner = ?",
+                (new_filename, filename, owner)
+            )
+            row = db.execute(
+                "SELECT storage_key FROM file_metadata WHERE filename = ? AND owner = ?", (new_filename, owner)
+            ).fetchone()
+        else:
+            row = db.execute(
+                "SELECT storage_key FROM file_metadata WHERE filename = ? AND owner = ?", (filename, owner)
+            ).fetchone()
+            if row is not None:
+                print(f"[SELF-HEALING] {filename} for user {owner} is no longer critical, skipping")
+                return False
+    for storage_key in replaced:
+        BlobStore.release(storage_key)
+
+    # 2. Move/Rename in SkyStore (server-side, no data passes through this process).
+    # Blob-backed files are shared by content, so only their metadata is renamed.
+    if not (row and row["storage_key"]):
+        if not SkyStore.move(owner, filename, new_filename) and SkyStore.stat(owner, new_filename) is None:
+            print(f"[SELF-HEALING] {filename} for user {owner} no longer exists, skipping")
+            return False
+
+    # 3. Log the action
+    AuditLogger.log_event(
+        owner,
+        f"Critical Self-Healing Action: Quarantined {filename} (Risk: {risk_score})",
+        "healed"
+    )
+    print(f"[SELF-HEALING] Quarantined {filename} for user {owner}")
+    return True
+
+class QuarantineWorker:
+    """
+    Drains the quarantine queue. Every process runs one of these, but only the
+    holder of the `self_healing` lease (table job_leases) processes jobs, with
+    up to QUARANTINE_CONCURRENCY files in parallel.
+    """
+
+    def __init__(self):
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self._next_lease_check = 0.0
+
+    def _acquire_lease(self):
+        now = int(time.time())
+        with get_db_context() as db:
+            db.execute("""
+                INSERT INTO job_leases (name, holder, expires_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET
+                    holder = excluded.holder,
+                    expires_at = excluded.expires_at
+                WHERE job_leases.expires_at < ? OR job_leases.holder = excluded.holder
+            """, (LEASE_NAME, self.holder, now + QUARANTINE_LEASE_TTL, now))
+            row = db.execute("SELECT holder FROM job_leases WHERE name = ?", (LEASE_NAME,)).fetchone()
+        return row is not None and row["holder"] == self.holder
+
+    def _check_lease(self):
+        """Renews (or tries to take) the lease every QUARANTINE_LEASE_TTL / 3 seconds."""
+        now = time.monotonic()
+        if now < self._next_lease_check:
+            return self.is_leader
+        was_leader = self.is_leader
+        self.is_leader = False  # stays False if the renewal raises
+        self.is_leader = self._acquire_lease()
+        self._next_lease_check = now + QUARANTINE_LEASE_TTL / 3
+        if self.is_leader and not was_leader:
+            print(f"[SELF-HEALING] {self.holder} is now the quarantine leader")
+            QuarantineQueue.backfill()
+        elif was_leader and not self.is_leader:
+            print(f"[SELF-HEALING] {self.holder} lost the quarantine lease")
+        return self.is_leader
+
+    def _process(self, job):
+        try:
+            quarantine_file(job["owner"], job["filename"], job["risk_score"])
+            QuarantineQueue.complete(job["id"])
         except Exception as e:
-            print(f"[SELF-HEALING ERROR] {e}")
+            print(f"[SELF-HEALING ERROR] {job['filename']} for user {job['owner']}: {e}")
+            QuarantineQueue.fail(job, e)
+
+    def _drain(self, pool):
+        # A long backlog outlives the lease: keep renewing it, and stop once another node has it
+        while self._check_lease():
+            jobs = QuarantineQueue.claim(QUARANTINE_CONCURRENCY, QUARANTINE_LEASE_TTL)
+            if not jobs:
+                return
+            list(pool.map(self._process, jobs))
+
+    def run(self):
+        with ThreadPoolExecutor(max_workers=QUARANTINE_CONCURRENCY) as pool:
+            while True:
+                try:
+                    if self._check_lease():
+                        self._drain(pool)
+                except Exception as e:
+                    print(f"[SELF-HEALING ERROR] {e}")
 
-        # Check every 60 seconds (can be adjusted)
-        time.sleep(60)
+                _wake.wait(QUARANTINE_POLL_INTERVAL if self.is_leader else QUARANTINE_LEASE_TTL / 3)
+                _wake.clear()
+
+_worker_pid = None
 
 def start_self_healing():
-    """Starts the self-healing monitor in a background thread."""
-    thread = threading.Thread(target=monitor_and_heal, daemon=True)
+    """Starts this process's quarantine worker in a background thread."""
+    global _worker_pid
+    if _worker_pid == os.getpid():
+        return
+    _worker_pid = os.getpid()
+    thread = threading.Thread(target=QuarantineWorker().run, name="self-healing", daemon=True)
     thread.start()
     print("[SYSTEM] Self-Healing Module Started.")
+
+def _restart_after_fork():
+    # Threads do not survive fork (e.g. gunicorn --preload): restart in workers that had one
+    _wake.clear()
+    if _worker_pid is not None:
+        start_self_healing()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
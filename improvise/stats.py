@@ -0,0 +1,55 @@
+import time
+import threading
+from config import STATS_CACHE_TTL
+from .db import get_db_context
+
+class StatsEngine:
+    """
+    Admin dashboard aggregates. Everything is computed in one pass over
+    file_metadata and cached for STATS_CACHE_TTL seconds, so dashboard polling
+    does not rescan the table. The cache lives in the admin process while files
+    change in the user app, so the dashboard may lag by up to STATS_CACHE_TTL.
+    """
+
+    _cache = None
+    _expires_at = 0.0
+    _lock = threading.Lock()
+
+    @staticmethod
+    def compute():
+        with get_db_context() as db:
+            row = db.execute("""
+                SELECT
+                    (SELECT COUNT(*) FROM users) AS total_users,
+                    COUNT(*) AS total_files,
+                    AVG(risk_score) AS avg_risk,
+                    SUM(CASE WHEN is_active = 0 THEN 1 ELSE 0 END) AS quarantined,
+                    SUM(CASE WHEN risk_score < 50 THEN 1 ELSE 0 END) AS safe,
+                    SUM(CASE WHEN risk_score >= 50 AND risk_score < 80 THEN 1 ELSE 0 END) AS warning,
+                    SUM(CASE WHEN risk_score >= 80 THEN 1 ELSE 0 END) AS critical
+                FROM file_metadata
+            """).fetchone()
+
+        return {
+            "total_users": row["total_users"],
+            "total_files": row["total_files"],
+            "avg_risk": round(float(row["avg_risk"]), 1) if row["avg_risk"] else 0,
+            "quarantined": int(row["quarantined"] or 0),
+            "risk_dist": {
+                "safe": int(row["safe"] or 0),
+                "warning": int(row["warning"] or 0),
+                "critical": int(row["critical"] or 0)
+            }
+        }
+
+    @staticmethod
+    def get_stats():
+        """Cached stats; only one thread recomputes when the entry expires."""
+        if StatsEngine._cache is not None and time.monotonic() < StatsEngine._expires_at:
+            return StatsEngine._cache
+
+        with StatsEngine._lock:
+            if StatsEngine._cache is None or time.monotonic() >= StatsEngine._expires_at:
+                StatsEngine._cache = StatsEngine.compute()
+                StatsEngine._expires_at = time.monotonic() + STATS_CACHE_TTL
+            return StatsEngine._cache
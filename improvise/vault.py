@@ -1,42 +1,220 @@
 import os
+import struct
 from cryptography.fernet import Fernet
-from config import SECRET_KEY
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from config import SECRET_KEY, VAULT_CHUNK_SIZE
 import base64
 import hashlib
 
+# 📦 Chunked container layout (version 1):
+#   header  = MAGIC | version (1 byte) | chunk_size (uint32 BE) | salt (16 bytes)
+#   segment = AES-256-GCM(chunk) | tag (16 bytes), one per plaintext chunk
+# Every segment except the last holds exactly `chunk_size` plaintext bytes.
+# The nonce is derived from the segment index plus a "last segment" flag and
+# the header is bound as associated data, so reordering, truncation or
+# tampering with any segment fails authentication.
+MAGIC = b"\x89CXV"  # Fernet tokens always start with b"gAAAAA", so no overlap
+VERSION = 1
+SALT_LEN = 16
+TAG_LEN = 16
+HEADER_LEN = len(MAGIC) + 1 + 4 + SALT_LEN
+
 # Derive a consistent 32-byte key from the project's SECRET_KEY
 def get_vault_key():
     key = hashlib.sha256(SECRET_KEY.encode()).digest()
     return base64.urlsafe_b64encode(key)
 
+def _derive_segment_key(salt):
+    """Derives a per-file AES-256 key so nonces never repeat across files."""
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=salt,
+        info=b"cryptexdrive-vault-v1",
+    ).derive(hashlib.sha256(SECRET_KEY.encode()).digest())
+
+def _nonce(index, last):
+    return struct.pack(">QI", index, 1 if last else 0)
+
+def iter_chunks(fileobj, chunk_size=None):
+    """Yields a binary file-like object in fixed-size blocks."""
+    chunk_size = chunk_size or VAULT_CHUNK_SIZE
+    while True:
+        block = fileobj.read(chunk_size)
+        if not block:
+            break
+        yield block
+
 class Vault:
     """Handles file encryption and decryption at rest."""
-    
+
+    @staticmethod
+    def is_chunked(prefix):
+        """True if the bytes start a chunked container (False for legacy Fernet blobs)."""
+        return prefix[:len(MAGIC)] == MAGIC
+
+    @staticmethod
+    def parse_header(header):
+        """Validates a chunked container header and returns its chunk size."""
+        if len(header) < HEADER_LEN or not Vault.is_chunked(header):
+            raise ValueError("Truncated or invalid vault header")
+        version, chunk_size = struct.unpack(">BI", header[len(MAGIC):len(MAGIC) + 5])
+        if version != VERSION:
+            raise ValueError(f"Unsupported vault format version: {version}")
+        return chunk_size
+
+    @staticmethod
+    def plaintext_size(header, encrypted_size):
+        """Plaintext length of a chunked container, from its header and total size."""
+        chunk_size = Vault.parse_header(header)
+        body = encrypted_size - HEADER_LEN
+        segments = max(1, -(-body // (chunk_size + TAG_LEN)))
+        return body - segments * TAG_LEN
+
+    @staticmethod
+    def encrypt_stream(chunks, chunk_size=None):
+        """
+        Encrypts an iterable of plaintext byte blocks into the chunked container.
+        Yields the header followed by one sealed segment per `chunk_size` bytes,
+        so memory use is bounded by the chunk size rather than the file size.
+        """
+        chunk_size = chunk_size or VAULT_CHUNK_SIZE
+        salt = os.urandom(SALT_LEN)
+        header = MAGIC + struct.pack(">BI", VERSION, chunk_size) + salt
+        aead = AESGCM(_derive_segment_key(salt))
+        yield header
+
+        buf = bytearray()
+        index = 0
+        for data in chunks:
+            buf += data
+            # Keep at least one byte back: the final segment is only known at EOF
+            if len(buf) <= chunk_size:
+                continue
+            view = memoryview(buf)
+            offset = 0
+            while len(buf) - offset > chunk_size:
+                block = bytes(view[offset:offset + chunk_size])
+                yield aead.encrypt(_nonce(index, False), block, header)
+                offset += chunk_size
+                index += 1
+            view.release()
+            del buf[:offset]
+
+        yield aead.encrypt(_nonce(index, True), bytes(buf), header)
+
+    @staticmethod
+    def decrypt_stream(chunks):
+        """
+        Decrypts an iterable of encrypted byte blocks, yielding plaintext per segment.
+        Legacy whole-file Fernet blobs are detected and decrypted in one piece.
+        """
+        chunks = iter(chunks)
+        buf = bytearray()
+        for data in chunks:
+            buf += data
+            if len(buf) >= HEADER_LEN:
+                break
+
+        if not Vault.is_chunked(buf):
+            # Legacy format: Fernet needs the whole token
+            for data in chunks:
+                buf += data
+            yield Fernet(get_vault_key()).decrypt(bytes(buf))
+            return
+
+        header = bytes(buf[:HEADER_LEN])
+        chunk_size = Vault.parse_header(header)
+        aead = AESGCM(_derive_segment_key(header[-SALT_LEN:]))
+        segment_size = chunk_size + TAG_LEN
+        del buf[:HEADER_LEN]
+
+        index = 0
+        while True:
+            # Only a segment followed by more data is known not to be the last one
+            if len(buf) > segment_size:
+                view = memoryview(buf)
+                offset = 0
+                while len(buf) - offset > segment_size:
+                    segment = bytes(view[offset:offset + segment_size])
+                    yield aead.decrypt(_nonce(index, False), segment, header)
+                    offset += segment_size
+                    index += 1
+                view.release()
+                del buf[:offset]
+            data = next(chunks, None)
+            if data is None:
+                break
+            buf += data
+
+        if len(buf) < TAG_LEN:
+            raise ValueError("Truncated vault stream")
+        yield aead.decrypt(_nonce(index, True), bytes(buf), header)
+
+    @staticmethod
+    def decrypt_range(header, encrypted_size, read_range, start, stop):
+        """
+        Yields plaintext bytes [start, stop) of a chunked container, decrypting
+        only the segments that overlap the range.
+        `read_range(offset, length)` must yield the encrypted bytes at that offset.
+        """
+        if start >= stop:
+            return
+        chunk_size = Vault.parse_header(header)
+        segment_size = chunk_size + TAG_LEN
+        segments = max(1, -(-(encrypted_size - HEADER_LEN) // segment_size))
+        aead = AESGCM(_derive_segment_key(header[-SALT_LEN:]))
+
+        first = start // chunk_size
+        last = (stop - 1) // chunk_size
+        offset = HEADER_LEN + first * segment_size
+        length = min(encrypted_size, HEADER_LEN + (last + 1) * segment_size) - offset
+
+        def open_segment(segment, index):
+            plain = aead.decrypt(_nonce(index, index == segments - 1), segment, header)
+            base = index * chunk_size
+            return plain[max(start - base, 0):stop - base]
+
+        buf = bytearray()
+        index = first
+        for data in read_range(offset, length):
+            buf += data
+            if len(buf) < segment_size:
+                continue
+            view = memoryview(buf)
+            pos = 0
+            while len(buf) - pos >= segment_size:
+                yield open_segment(bytes(view[pos:pos + segment_size]), index)
+                pos += segment_size
+                index += 1
+            view.release()
+            del buf[:pos]
+
+        if buf or index <= last:
+            yield open_segment(bytes(buf), index)
+
     @staticmethod
     def encrypt_data(data):
         """Encrypts bytes in memory."""
-        fernet = Fernet(get_vault_key())
-        return fernet.encrypt(data)
+        return b"".join(Vault.encrypt_stream([data]))
 
     @staticmethod
     def decrypt_data(encrypted_data):
-        """Decrypts bytes in memory."""
-        fernet = Fernet(get_vault_key())
-        return fernet.decrypt(encrypted_data)
+        """Decrypts bytes in memory (chunked or legacy Fernet)."""
+        return b"".join(Vault.decrypt_stream([encrypted_data]))
 
     @staticmethod
     def encrypt_file(file_path):
-        with open(file_path, "rb") as f:
-            data = f.read()
-        
-        encrypted_data = Vault.encrypt_data(data)
-        with open(file_path, "wb") as f:
-            f.write(encrypted_data)
+        tmp_path = f"{file_path}.enc.tmp"
+        with open(file_path, "rb") as src, open(tmp_path, "wb") as dst:
+            for segment in Vault.encrypt_stream(iter_chunks(src)):
+                dst.write(segment)
+        os.replace(tmp_path, file_path)
         return True
 
     @staticmethod
     def decrypt_file_data(file_path):
         with open(file_path, "rb") as f:
-            encrypted_data = f.read()
-        
-        return Vault.decrypt_data(encrypted_data)
+            return b"".join(Vault.decrypt_stream(iter_chunks(f)))
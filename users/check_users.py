@@ -1,13 +1,10 @@
-import sqlite3
-conn = sqlite3.connect("cryptex.db")
-cur = conn.cursor()
+from database import get_db
 try:
-    cur.execute("SELECT username, is_admin FROM users")
-    rows = cur.fetchall()
+    with get_db() as conn:
+        rows = conn.execute("SELECT username, is_admin FROM users").fetchall()
     print("Username | Is Admin")
     print("-" * 20)
     for row in rows:
         print(f"{row[0]} | {row[1]}")
 except Exception as e:
     print(f"Error: {e}")
-conn.close()
@@ -1,9 +1,11 @@
-import sqlite3
 import os
 import shutil
 import sys
+from database import get_db
+from improvise.db import init_enhanced_tables
+from improvise.blobstore import BlobStore
+from engine.gatekeeper import invalidate_user
 
-DB_NAME = "cryptex.db"
 UPLOAD_FOLDER = "uploads"
 
 def delete_user_completely(username):
@@ -11,53 +13,49 @@ def delete_user_completely(username):
         print("Error: No username provided.")
         return
 
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
+    # Make sure file_metadata exists, so one transaction can cover both tables
+    init_enhanced_tables()
 
     try:
-        # 1. Check if user exists
-        cur.execute("SELECT id FROM users WHERE username = ?", (username,))
-        user = cur.fetchone()
-        
-        if not user:
-            print(f"[-] User '{username}' not found in database.")
-            return
+        with get_db() as conn:
+            # 1. Check if user exists
+            user = conn.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()
+            
+            if not user:
+                print(f"[-] User '{username}' not found in database.")
+                return
 
-        # 2. Delete from users table
-        cur.execute("DELETE FROM users WHERE username = ?", (username,))
-        
-        # 3. Delete from file_metadata table (if it exists)
-        try:
-            cur.execute("DELETE FROM file_metadata WHERE owner = ?", (username,))
-        except sqlite3.OperationalError:
-            # Table doesn't exist yet, which is fine
-            pass
-        
-        # 4. Remove physical files
-        user_dir = os.path.join(UPLOAD_FOLDER, username)
-        if os.path.exists(user_dir):
-            shutil.rmtree(user_dir)
-            print(f"[+] Deleted file directory: {user_dir}")
-        
-        conn.commit()
-        print(f"[+] Successfully removed user '{username}' and all associated data.")
+            # 2. Delete from users table
+            conn.execute("DELETE FROM users WHERE username = ?", (username,))
 
+            # 3. Delete from file_metadata table in the same transaction
+            storage_keys = BlobStore.remove_entries(conn, username)
+        invalidate_user(username)
     except Exception as e:
         print(f"[!] Error: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
+        return
+
+    # Shared blobs are released only once the rows referencing them are gone
+    for storage_key in storage_keys:
+        BlobStore.release(storage_key)
+    
+    # 4. Remove physical files
+    user_dir = os.path.join(UPLOAD_FOLDER, username)
+    if os.path.exists(user_dir):
+        shutil.rmtree(user_dir)
+        print(f"[+] Deleted file directory: {user_dir}")
+    
+    print(f"[+] Successfully removed user '{username}' and all associated data.")
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         print("Usage: python delete_user_manually.py <username>")
         print("\nExisting users:")
         try:
-            conn = sqlite3.connect(DB_NAME)
-            users = conn.execute("SELECT username FROM users").fetchall()
+            with get_db() as conn:
+                users = conn.execute("SELECT username FROM users").fetchall()
             for u in users:
                 print(f" - {u[0]}")
-            conn.close()
         except Exception as e:
             print(f"Error listing users: {e}")
     else: